@@ -1,89 +1,287 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import shutil
 import os
-from typing import List, Tuple
+import json
+import time
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
 from langchain_core.messages import HumanMessage, AIMessage
 import traceback
-import sys
 
 # Import our new chain object
 # from app.core.rag_core import *
-from app.core import rag_core
+from app.core import metrics, rag_core
+from app.core.concurrency import run_blocking, chat_slots
+from app.core.jobs import job_manager
+from app.core.llm_gateway import GatewayBusy, gateway, queue_key
+from app.core.sessions import session_store
 
 
 router = APIRouter()
 
+class ChatFilters(BaseModel):
+    # Only search chunks matching every filter that is set
+    sources: List[str] = []                 # file names or URLs, as in GET /api/sources
+    file_types: List[str] = []              # "pdf", "csv", "website"
+    columns: Dict[str, Union[str, List[str]]] = {}  # CSV column -> value(s)
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "sources": self.sources,
+            "file_types": self.file_types,
+            "columns": self.columns,
+            "ingested_after": self.ingested_after.timestamp() if self.ingested_after else None,
+            "ingested_before": self.ingested_before.timestamp() if self.ingested_before else None,
+        }
+
 # MODIFIED: Pydantic model now includes chat_history
 class ChatRequest(BaseModel):
     query: str
-    # The history is a list of (human_message, ai_message) tuples
+    # Server-side conversation to continue, as returned by POST /sessions or
+    # by an earlier chat with new_session; unknown ids get a 404
+    session_id: Optional[str] = None
+    # Starts a server-side conversation with this question; its id is
+    # returned with the answer
+    new_session: bool = False
+    # Legacy stateless mode: the client resends the whole history as a list
+    # of (human_message, ai_message) tuples. Ignored with a session.
     chat_history: List[Tuple[str, str]] = []
+    # Adds per-stage latencies (rewrite, embedding, search, LLM...) to the response
+    include_timings: bool = False
+    # Knowledge base (tenant) to answer from; None means the default one
+    knowledge_base: Optional[str] = None
+    # Metadata pre-filters applied to retrieval (and to follow-up questions)
+    filters: Optional[ChatFilters] = None
 
 class ChatResponse(BaseModel):
     answer: str
     source_documents: list
 
 class WebsiteRequest(BaseModel):
-    url: str
+    # Any combination of a single URL, a list of URLs and a sitemap URL
+    url: Optional[str] = None
+    urls: List[str] = []
+    sitemap: Optional[str] = None
+    knowledge_base: Optional[str] = None
+
+class KnowledgeBaseRequest(BaseModel):
+    # 3-56 letters, digits, '.', '_' or '-'
+    name: str
+
+class SourceRequest(BaseModel):
+    # File name or URL, as listed by GET /api/sources
+    source: str
+    knowledge_base: Optional[str] = None
 
-@router.post("/upload", status_code=201)
-async def upload_document(file: UploadFile = File(...)):
 
-    temp_file_path = f"temp_{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+async def _knowledge_base(name: Optional[str]):
+    """The named knowledge base; 400 for an invalid name, 404 for one never created."""
+    try:
+        # Looking up a name not loaded yet lists the Chroma collections
+        return await run_blocking(rag_core.knowledge_bases.get, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def _busy(error: GatewayBusy):
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
 
+
+def _admit():
+    """Refuses a chat up front (429) while the LLM queue is full."""
     try:
-        if file.filename.lower().endswith(".pdf"):
-            rag_core.ingest_documents(temp_file_path)
-            return {"message": f"PDF '{file.filename}' ingested successfully."}
-        elif file.filename.lower().endswith(".csv"):
-            rag_core.ingest_structured_data(temp_file_path)
-            return {"message": f"CSV '{file.filename}' ingested successfully."}
-        else:
-            print(f"Unsupported file type: {file.filename}")
-            raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a PDF or CSV.")
+        gateway.check_admission()
+    except GatewayBusy as e:
+        raise _busy(e)
+
+
+def _format_history(chat_history):
+    """Turns the (human, ai) tuples sent by the client into LangChain messages."""
+    formatted_history = []
+    for human, ai in chat_history:
+        formatted_history.append(HumanMessage(content=human))
+        formatted_history.append(AIMessage(content=ai))
+    return formatted_history
+
+
+async def _chat_payload(request: ChatRequest, knowledge_base):
+    """
+    Builds the chain input and returns it with the session id (None in
+    legacy mode, where the client sent its own chat_history).
+    """
+    filters = request.filters.to_dict() if request.filters else None
+    if request.session_id:
+        session = await _session(knowledge_base.name, request.session_id)
+    elif request.new_session:
+        session = await run_blocking(session_store.create, knowledge_base.name)
+    else:
+        return {"input": request.query, "chat_history": _format_history(request.chat_history), "filters": filters}, None
+    return {"input": request.query, "chat_history": session.messages(), "filters": filters}, session.id
+
+
+async def _session(kb_name, session_id):
+    """The session of this knowledge base; 404 if unknown or expired."""
+    session = await run_blocking(session_store.get, kb_name, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+    return session
+
+
+def _format_sources(documents):
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def _sse(event: str, data: dict) -> str:
+    """Encodes one server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+UPLOAD_COPY_BUFFER = 1024 * 1024
+
+
+def _save_upload(source, path):
+    # Copy in fixed 1 MB pieces so large uploads never sit in memory whole
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, UPLOAD_COPY_BUFFER)
+
+
+def _job_response(job, message):
+    return {"message": message, "job_id": job.id, "status_url": f"/api/jobs/{job.id}"}
+
+
+@router.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...), knowledge_base: Optional[str] = None):
+    """
+    Saves the upload and queues it for background ingestion into the given
+    knowledge base. Returns a job id that can be polled at /api/jobs/{job_id}.
+    """
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    filename = os.path.basename(file.filename)
+    if filename.lower().endswith(".pdf"):
+        kind, ingest = "pdf", rag_core.ingest_documents
+    elif filename.lower().endswith(".csv"):
+        kind, ingest = "csv", rag_core.ingest_structured_data
+    else:
+        print(f"Unsupported file type: {file.filename}")
+        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a PDF or CSV.")
+
+    # Each upload gets its own temp dir so concurrent uploads of the same
+    # name don't clash and the stored source keeps the original filename.
+    temp_dir = tempfile.mkdtemp(prefix="upload_")
+    temp_file_path = os.path.join(temp_dir, filename)
+    try:
+        await run_blocking(_save_upload, file.file, temp_file_path)
     except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
-    finally:
-        os.remove(temp_file_path)
-@router.post("/chat")
-async def chat_with_rag(request: ChatRequest):
 
-    print(f"--- CHECKPOINT 2 [AT CHAT START] --- Type of conversational_chain is: {type(rag_core.conversational_chain)}")
+    job = job_manager.submit(
+        kind, filename, ingest, temp_file_path, kb_name,
+        cleanup=lambda: shutil.rmtree(temp_dir, ignore_errors=True),
+    )
+    return _job_response(job, f"{kind.upper()} '{filename}' queued for ingestion.")
+
+
+@router.post("/sessions", status_code=201)
+async def create_session(knowledge_base: Optional[str] = None):
+    """Starts a server-side conversation; pass its id as session_id to /chat."""
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    return {"session_id": (await run_blocking(session_store.create, kb_name)).id}
 
-    # --- START OF FIX ---
-    # Add a check to see if the chain has been initialized
-    if rag_core.conversational_chain is None:
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str, knowledge_base: Optional[str] = None):
+    """The turns kept verbatim for a session plus the summary of older ones."""
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    return (await _session(kb_name, session_id)).to_dict()
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, knowledge_base: Optional[str] = None):
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    if not await run_blocking(session_store.delete, kb_name, session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+    return {"message": f"Session '{session_id}' deleted."}
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """Lists recent ingestion jobs, newest first."""
+    return {"jobs": [job.to_dict() for job in reversed(job_manager.list())]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Reports the stage, chunks embedded and throughput of an ingestion job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job.to_dict()
+
+
+async def _require_documents(name: Optional[str]):
+    """Returns the knowledge base, or 400 if nothing was ingested into it yet."""
+    knowledge_base = await _knowledge_base(name)
+    # Opening the knowledge base touches disk the first time, so do it off the loop
+    state = await run_blocking(knowledge_base.current)
+    if not state.has_documents:
         raise HTTPException(status_code=400, detail="No document has been uploaded yet. Please upload a document first.")
-    # --- END OF FIX ---
+    return knowledge_base
+
+
+@router.post("/chat")
+async def chat_with_rag(request: ChatRequest):
+
+    knowledge_base = await _require_documents(request.knowledge_base)
+    _admit()
+    # This dictionary MUST contain the 'input' key
+    invoke_payload, session_id = await _chat_payload(request, knowledge_base)
 
     try:
-        formatted_history = []
-        for human, ai in request.chat_history:
-            formatted_history.append(HumanMessage(content=human))
-            formatted_history.append(AIMessage(content=ai))
-        
-        # This dictionary MUST contain the 'input' key
-        invoke_payload = {
-            "input": request.query,
-            "chat_history": formatted_history
-        }
-        
         # Optional: Print the payload for debugging
         # print("Invoking chain with payload:", invoke_payload)
         
-        result = rag_core.conversational_chain.invoke(invoke_payload)
+        # ainvoke keeps the event loop free while Ollama generates; the
+        # snapshot keeps this chat's collection alive through a reset
+        timings = metrics.Timings()
+        async with chat_slots(), knowledge_base.asnapshot() as kb:
+            with metrics.tracking(timings), queue_key(knowledge_base.name):
+                cached, question_vector, cache_epoch = await rag_core.alookup_answer(invoke_payload, kb)
+                if cached:
+                    result = {"answer": cached.answer, "context": cached.context}
+                else:
+                    started = time.perf_counter()
+                    result = await kb.chain.ainvoke(
+                        invoke_payload,
+                        config={"callbacks": [metrics.LLMTimingHandler(timings)]},
+                    )
+                    rag_core.cache_answer(question_vector, cache_epoch, result, time.perf_counter() - started, kb)
+        metrics.observe_chat(timings, cached=bool(cached))
+        if session_id:
+            await run_blocking(session_store.append, knowledge_base.name, session_id, request.query, result['answer'])
         
         # The new chain returns context under the 'context' key
-        sources = [{"content": doc.page_content, "metadata": doc.metadata} for doc in result['context']]
+        sources = _format_sources(result['context'])
         
-        return {
+        response = {
             "answer": result['answer'], 
             "sources": sources,
+            "cached": bool(cached),
+            "session_id": session_id,
         }
+        if request.include_timings:
+            response["timings"] = timings.to_dict()
+        return response
+    except GatewayBusy as e:
+        raise _busy(e)
     except Exception as e:
         print(f"Error during chat: {e}")
         # For better debugging, you might want to log the full traceback
@@ -92,24 +290,227 @@ async def chat_with_rag(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/ingest-website", status_code=201)
-async def ingest_website_endpoint(request: WebsiteRequest):
-    """Endpoint to ingest data from a website URL."""
+async def _stream_chat_events(knowledge_base, payload, include_timings=False, session_id=None):
+    """
+    Runs the chain in streaming mode and yields SSE frames: one 'sources'
+    frame as soon as retrieval finishes, one 'token' frame per LLM chunk and
+    a final 'done' frame with the full answer, timings and session id. The
+    turn is added to the session only once the answer is complete.
+
+    The chat runs in its own task, which holds the snapshot, the chat and
+    LLM slots and the context variables; this generator only relays its
+    frames. If the client disconnects and the generator is closed from
+    another context, cancelling the task still releases all of them.
+    """
+    frames = asyncio.Queue()
+    task = asyncio.create_task(
+        _run_stream_chat(knowledge_base, payload, frames.put_nowait, include_timings, session_id)
+    )
     try:
-        rag_core.ingest_website(request.url)
-        return {"message": f"Content from URL '{request.url}' ingested successfully."}
+        while True:
+            frame = await frames.get()
+            if frame is None:
+                return
+            yield frame
+    finally:
+        task.cancel()
+
+
+async def _run_stream_chat(knowledge_base, payload, emit, include_timings, session_id):
+    """Body of _stream_chat_events: passes each SSE frame to `emit`, then None."""
+    started = time.perf_counter()
+    first_token_at = None
+    answer_parts = []
+    context = []
+    timings = metrics.Timings()
+    try:
+        async with chat_slots(), knowledge_base.asnapshot() as kb:
+            with metrics.tracking(timings), queue_key(knowledge_base.name):
+                cached, question_vector, cache_epoch = await rag_core.alookup_answer(payload, kb)
+                if cached:
+                    metrics.observe_chat(timings, cached=True)
+                    if session_id:
+                        await run_blocking(session_store.append, knowledge_base.name, session_id,
+                                           payload["input"], cached.answer)
+                    emit(_sse("sources", {"sources": _format_sources(cached.context)}))
+                    emit(_sse("token", {"token": cached.answer}))
+                    done = {
+                        "answer": cached.answer,
+                        "tokens": 1,
+                        "cached": True,
+                        "session_id": session_id,
+                        "time_to_first_token_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                    }
+                    if include_timings:
+                        done["timings"] = timings.to_dict()
+                    emit(_sse("done", done))
+                    return
+                handler = metrics.LLMTimingHandler(timings)
+                async for chunk in kb.chain.astream(payload, config={"callbacks": [handler]}):
+                    if "context" in chunk:
+                        context = chunk["context"]
+                        emit(_sse("sources", {"sources": _format_sources(context)}))
+                    if "answer" in chunk and chunk["answer"]:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        answer_parts.append(chunk["answer"])
+                        emit(_sse("token", {"token": chunk["answer"]}))
+
+        finished = time.perf_counter()
+        metrics.observe_chat(timings, cached=False)
+        answer = "".join(answer_parts)
+        if session_id:
+            await run_blocking(session_store.append, knowledge_base.name, session_id, payload["input"], answer)
+        rag_core.cache_answer(question_vector, cache_epoch, {
+            "standalone_question": payload["standalone_question"],
+            "answer": answer,
+            "context": context,
+        }, finished - started, kb)
+        done = {
+            "answer": answer,
+            "tokens": len(answer_parts),
+            "cached": False,
+            "session_id": session_id,
+            "time_to_first_token_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            "total_ms": round((finished - started) * 1000, 1),
+        }
+        if include_timings:
+            done["timings"] = timings.to_dict()
+        emit(_sse("done", done))
+    except GatewayBusy as e:
+        emit(_sse("error", {"detail": str(e), "retry_after": e.retry_after}))
     except Exception as e:
-        # For better debugging, you might want to log the full traceback
-        import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to ingest website: {str(e)}")
-    
+        emit(_sse("error", {"detail": str(e)}))
+    finally:
+        emit(None)
+
+
+@router.post("/chat/stream")
+async def chat_with_rag_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat using server-sent events. The sources are sent
+    first, then the answer token by token, then a summary frame.
+    """
+    knowledge_base = await _require_documents(request.knowledge_base)
+    _admit()
+
+    invoke_payload, session_id = await _chat_payload(request, knowledge_base)
+    return StreamingResponse(
+        _stream_chat_events(knowledge_base, invoke_payload, request.include_timings, session_id),
+        media_type="text/event-stream",
+        # Disable proxy buffering so tokens reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/ingest-website", status_code=202)
+async def ingest_website_endpoint(request: WebsiteRequest):
+    """Endpoint to queue a crawl of one or more URLs and/or a sitemap."""
+    urls = ([request.url] if request.url else []) + request.urls
+    if not urls and not request.sitemap:
+        raise HTTPException(status_code=400, detail="Provide a url, a list of urls or a sitemap.")
+    kb_name = (await _knowledge_base(request.knowledge_base)).name
+    if len(urls) > 1:
+        target = f"{len(urls)} URLs"
+    else:
+        target = urls[0] if urls else request.sitemap
+    job = job_manager.submit("website", target, rag_core.ingest_website, urls, request.sitemap, kb_name)
+    return _job_response(job, f"Content from '{target}' queued for ingestion.")
+
+
+@router.get("/sources")
+async def list_sources(knowledge_base: Optional[str] = None):
+    """Lists the files and pages in a knowledge base with their content hash and chunk count."""
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    return {"sources": await run_blocking(rag_core.list_sources, kb_name)}
+
+
+@router.delete("/sources")
+async def delete_source(source: str, knowledge_base: Optional[str] = None):
+    """Removes one source's chunks (and CSV table) without resetting the knowledge base."""
+    kb_name = (await _knowledge_base(knowledge_base)).name
+    if not await run_blocking(rag_core.delete_source, source, kb_name):
+        raise HTTPException(status_code=404, detail=f"Source '{source}' not found.")
+    return {"message": f"Source '{source}' deleted."}
+
+
+@router.post("/sources/resync", status_code=202)
+async def resync_source(request: SourceRequest):
+    """
+    Re-crawls one website source; only changed chunks are re-embedded and
+    chunks the page no longer has are removed. Files are updated by
+    uploading them again under the same name.
+    """
+    kb_name = (await _knowledge_base(request.knowledge_base)).name
+    entry = await run_blocking(rag_core.get_source, request.source, kb_name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Source '{request.source}' not found.")
+    if entry["kind"] != "website":
+        raise HTTPException(status_code=400, detail="Only website sources can be re-synced; re-upload the file instead.")
+    job = job_manager.submit("website", request.source, rag_core.ingest_website, [request.source], None, kb_name)
+    return _job_response(job, f"Re-sync of '{request.source}' queued.")
+
+
+@router.get("/knowledge-bases")
+async def list_knowledge_bases():
+    """Lists the knowledge bases (tenants) and whether each is currently loaded."""
+    names = await run_blocking(rag_core.knowledge_bases.names)
+    loaded = {kb.name for kb in rag_core.knowledge_bases.loaded()}
+    return {
+        "default": rag_core.knowledge_bases.default_name,
+        "knowledge_bases": [{"name": name, "loaded": name in loaded} for name in names],
+    }
+
+
+@router.post("/knowledge-bases", status_code=201)
+async def create_knowledge_base(request: KnowledgeBaseRequest):
+    """Creates an empty knowledge base; the other endpoints refuse names not created here."""
+    if request.name in await run_blocking(rag_core.knowledge_bases.names):
+        raise HTTPException(status_code=409, detail=f"Knowledge base '{request.name}' already exists.")
+    try:
+        await run_blocking(rag_core.knowledge_bases.create, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Knowledge base '{request.name}' created.", "name": request.name}
+
+
+@router.get("/tables")
+async def list_tables(knowledge_base: Optional[str] = None):
+    """Lists the SQL tables created from uploaded CSVs and their column types."""
+    knowledge_base = await _knowledge_base(knowledge_base)
+    state = await run_blocking(knowledge_base.current)
+    return {"tables": state.structured_store.tables()}
+
+
+@router.get("/llm/stats")
+async def llm_gateway_stats():
+    """Queue depth, rejections and in-flight generations per Ollama instance."""
+    return gateway.stats()
+
+
+@router.get("/rerank/stats")
+async def rerank_stats():
+    """Calls, pairs scored, score cache hit rate and average overhead of the reranker."""
+    if rag_core.reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **rag_core.reranker.stats()}
+
+
+@router.get("/cache/stats")
+async def answer_cache_stats(knowledge_base: Optional[str] = None):
+    """Hit rate and generation time saved by the semantic answer cache."""
+    return (await _knowledge_base(knowledge_base)).answer_cache.stats()
+
+
 @router.post("/reset", status_code=200)
-async def reset_knowledge_base():
-    """Endpoint to reset the knowledge base."""
+async def reset_knowledge_base(knowledge_base: Optional[str] = None):
+    """Endpoint to reset one knowledge base (the default one if none is given)."""
+    kb_name = (await _knowledge_base(knowledge_base)).name
     try:
-        rag_core.reset_database()
-        return {"message": "Knowledge base has been reset successfully."}
+        await run_blocking(rag_core.reset_database, kb_name)
+        return {"message": f"Knowledge base '{kb_name}' has been reset successfully."}
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to reset database: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    context: list
+    generation_seconds: float
+    created_at: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """
+    Semantic cache of chat answers keyed on the embedding of the standalone
+    question. A lookup returns the most similar cached answer if its cosine
+    similarity reaches the threshold. Entries are evicted LRU once the cache
+    is full and expire after ttl_seconds; clear() is called whenever the
+    knowledge base changes. Each clear() starts a new epoch: a chat captures
+    the epoch before it retrieves, and store() drops its answer if the cache
+    was cleared meanwhile, since it was built from the old documents.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()   # id -> (unit vector, CachedAnswer)
+        self._matrix = None             # stacked vectors, rebuilt lazily after changes
+        self._keys = []
+        self._next_id = 0
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def lookup(self, vector):
+        if not self.enabled:
+            return None
+        query = _unit(vector)
+        with self._lock:
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            entry = self._entries[key][1]
+            self.hits += 1
+            self.saved_seconds += entry.generation_seconds
+            return entry
+
+    def store(self, vector, entry: CachedAnswer, epoch=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._entries[self._next_id] = (_unit(vector), entry)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_latency_seconds": round(self.saved_seconds, 2),
+        }
+
+    def _expire(self):
+        now = time.time()
+        expired = [key for key, (_, entry) in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+
+def _unit(vector):
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
@@ -0,0 +1,37 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import config
+
+# Bounded pool for the blocking ingestion pipeline. Embedding with torch and
+# parsing PDFs release the GIL for most of their runtime, so threads are
+# enough to keep the event loop free without pickling the vector store.
+ingest_executor = ThreadPoolExecutor(
+    max_workers=config.INGEST_MAX_WORKERS,
+    thread_name_prefix="ingest",
+)
+
+# Short blocking calls made while serving a request (saving an upload, opening
+# a collection, listing sources). Kept off the ingest pool so a long ingestion
+# never makes an API call wait for a free worker.
+request_executor = ThreadPoolExecutor(
+    max_workers=config.REQUEST_MAX_WORKERS,
+    thread_name_prefix="request",
+)
+
+_chat_semaphore = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking function in the request pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request_executor, functools.partial(func, *args, **kwargs))
+
+
+def chat_slots() -> asyncio.Semaphore:
+    """Semaphore limiting concurrent chat generations (created on first use)."""
+    global _chat_semaphore
+    if _chat_semaphore is None:
+        _chat_semaphore = asyncio.Semaphore(config.CHAT_MAX_CONCURRENCY)
+    return _chat_semaphore
@@ -0,0 +1,150 @@
+import os
+
+# --- Runtime settings ---
+# Every value can be overridden with an environment variable of the same name.
+
+# Chroma data plus the per-collection lexical index and CSV tables.
+KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "local_chroma_db")
+
+# --- Knowledge bases (tenants) ---
+# Requests pick a named knowledge base; each is opened on first use. At most
+# KB_MAX_LOADED are kept open, and one unused for KB_IDLE_SECONDS is closed
+# (its data stays on disk). The default knowledge base is always kept open.
+KB_MAX_LOADED = int(os.getenv("KB_MAX_LOADED", "8"))
+KB_IDLE_SECONDS = float(os.getenv("KB_IDLE_SECONDS", "900"))
+
+# Threads used to run blocking ingestion work (PDF parsing, HTTP fetches,
+# embedding, Chroma writes) off the asyncio event loop.
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+# Threads for the short blocking calls API routes make (file saves, source
+# listings, opening a knowledge base); separate from the ingest pool.
+REQUEST_MAX_WORKERS = int(os.getenv("REQUEST_MAX_WORKERS", "8"))
+
+# Maximum number of chats (retrieval plus generation) processed at the same
+# time. Extra requests wait on the event loop. Calls to Ollama itself are
+# limited and queued separately by the LLM gateway (see below).
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "64"))
+
+# How many finished ingestion jobs are kept around for GET /api/jobs.
+MAX_TRACKED_JOBS = int(os.getenv("MAX_TRACKED_JOBS", "500"))
+
+# --- Embedding pipeline ---
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# Chunks embedded (and written to Chroma) per batch. Bigger batches are
+# faster per chunk but hold more vectors in memory at once.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Worker processes sharding embedding batches across CPU cores.
+# 1 embeds in-process with the shared model.
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+
+# Persistent cache of chunk embeddings keyed by content hash + model name.
+# Set EMBEDDING_CACHE_PATH to an empty string to disable it.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "local_chroma_db/embedding_cache.sqlite")
+
+# --- Semantic answer cache ---
+# Answers are reused when a new standalone question's embedding has at least
+# ANSWER_CACHE_THRESHOLD cosine similarity with a cached one.
+# ANSWER_CACHE_SIZE=0 disables the cache.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# --- Question rewriting ---
+# Optional smaller Ollama model used only to turn follow-up questions into
+# standalone ones. Empty means reuse the main LLM.
+REWRITE_MODEL = os.getenv("REWRITE_MODEL", "")
+
+# When a follow-up needs rewriting, also start retrieval on the raw query in
+# parallel and reuse it if the rewrite comes back unchanged.
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+
+# --- Retrieval ---
+# Chunks passed to the answer prompt, and candidates fetched from each
+# retriever before fusion.
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+
+# Combine dense Chroma search with a BM25 index (good at exact ids / SKUs)
+# using reciprocal rank fusion.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+
+# --- Reranking ---
+# Optional CPU cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2).
+# When set, RERANK_CANDIDATES chunks are retrieved, scored against the
+# question in one batch, and only the best RERANK_TOP_N go into the prompt.
+# Pair scores are cached (RERANK_CACHE_SIZE entries). Empty disables it.
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+
+# --- Vector index ---
+# HNSW parameters for new Chroma collections: graph degree (M) and the
+# candidate list sizes used while building and searching. Higher values
+# raise recall at the cost of memory and latency. ef_search also applies
+# to existing collections.
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
+# --- Prompt budget ---
+# Before the answer prompt is built, retrieved chunks are de-duplicated
+# (neighbouring chunks share the splitter's overlap) and trimmed to the
+# sentences most relevant to the question until they fit in
+# CONTEXT_TOKEN_BUDGET; the chat history is cut to the most recent turns
+# that fit in HISTORY_TOKEN_BUDGET. Tokens are estimated as characters / 4.
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+CHARS_PER_TOKEN = int(os.getenv("CHARS_PER_TOKEN", "4"))
+
+# --- Chat sessions ---
+# Chat history is kept server-side per session_id: the last
+# SESSION_WINDOW_TURNS turns verbatim plus a rolling summary of older ones
+# (at most SESSION_SUMMARY_CHARS). Idle sessions expire after
+# SESSION_TTL_SECONDS; the least recently used are dropped beyond
+# SESSION_MAX_SESSIONS. Set SESSION_DB_PATH to also persist them in SQLite.
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+SESSION_WINDOW_TURNS = int(os.getenv("SESSION_WINDOW_TURNS", "6"))
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", "1000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+
+# --- Structured (CSV) data ---
+# CSV uploads are loaded into typed, indexed SQLite tables; filter and
+# aggregate questions are answered with SQL instead of vector search.
+STRUCTURED_MAX_ROWS = int(os.getenv("STRUCTURED_MAX_ROWS", "50"))
+
+# --- Models and startup ---
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemma:2b-instruct-q4_0")
+
+# --- LLM gateway ---
+# Every Ollama call goes through one gateway that pools HTTP connections and
+# runs at most LLM_MAX_IN_FLIGHT generations per Ollama instance. Others
+# wait in a queue shared fairly between knowledge bases; once LLM_MAX_QUEUE
+# are waiting, chats get 429 with a Retry-After estimate.
+# OLLAMA_BASE_URLS (comma separated) spreads generations over several
+# instances; it defaults to OLLAMA_BASE_URL.
+OLLAMA_BASE_URLS = [
+    url.strip() for url in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if url.strip()
+]
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# Load the embedding model and open the knowledge base in a background
+# thread right after startup instead of on the first request.
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+
+# --- Website crawling ---
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+# Politeness limits applied to each host separately
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "4"))
+CRAWL_PER_HOST_DELAY_SECONDS = float(os.getenv("CRAWL_PER_HOST_DELAY_SECONDS", "0.1"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+CRAWL_TIMEOUT_SECONDS = float(os.getenv("CRAWL_TIMEOUT_SECONDS", "20"))
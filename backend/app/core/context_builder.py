@@ -0,0 +1,142 @@
+import re
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.core import config
+from app.core.lexical_index import tokenize
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; good enough to budget a prompt."""
+    return len(text) // config.CHARS_PER_TOKEN + 1
+
+
+def _overlap(a: str, b: str, min_len: int = 30, max_len: int = 400) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    if len(b) < min_len:
+        return 0
+    tail = a[-max_len:]
+    probe = b[:min_len]
+    start = tail.find(probe)
+    while start != -1:
+        if b.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def dedupe_overlaps(documents):
+    """
+    Drops chunks contained in a better-ranked chunk of the same source and
+    cuts the text a chunk shares with its neighbours (the splitter repeats
+    up to chunk_overlap characters at each boundary). Order is kept.
+    """
+    kept = []
+    for doc in documents:
+        text = doc.page_content
+        source = doc.metadata.get("source")
+        for other in kept:
+            if other.metadata.get("source") != source:
+                continue
+            if text in other.page_content:
+                text = ""
+                break
+            text = text[_overlap(other.page_content, text):]
+            cut = _overlap(text, other.page_content)
+            if cut:
+                text = text[:-cut]
+        text = text.strip()
+        if text:
+            kept.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+    return kept
+
+
+def _fits(documents, budget):
+    return sum(estimate_tokens(doc.page_content) for doc in documents) <= budget
+
+
+def trim_to_budget(documents, query: str, budget: int):
+    """
+    Keeps the sentences most relevant to the query until the token budget is
+    spent. Sentences are scored by how many query terms they contain, ties
+    going to better-ranked chunks; each chunk keeps its sentences in their
+    original order. SQL results are kept whole.
+    """
+    if _fits(documents, budget):
+        return documents
+
+    terms = set(tokenize(query))
+    candidates = []   # (score, doc rank, position, sentence)
+    selected = {}     # doc rank -> {position: sentence}
+    for rank, doc in enumerate(documents):
+        if "sql" in doc.metadata:
+            selected[rank] = {0: doc.page_content}
+            budget -= estimate_tokens(doc.page_content)
+            continue
+        for position, sentence in enumerate(s for s in _SENTENCE_RE.split(doc.page_content) if s.strip()):
+            score = len(terms & set(tokenize(sentence)))
+            candidates.append((-score, rank, position, sentence.strip()))
+
+    for _, rank, position, sentence in sorted(candidates):
+        cost = estimate_tokens(sentence)
+        if cost > budget:
+            continue
+        selected.setdefault(rank, {})[position] = sentence
+        budget -= cost
+
+    trimmed = []
+    for rank, doc in enumerate(documents):
+        if rank in selected:
+            sentences = selected[rank]
+            trimmed.append(Document(
+                page_content=" ".join(sentences[p] for p in sorted(sentences)),
+                metadata=doc.metadata,
+                id=doc.id,
+            ))
+    return trimmed
+
+
+def build_context(documents, query: str, budget: int = None):
+    """Deduplicated, query-trimmed chunks that fit in `budget` tokens."""
+    budget = config.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    return trim_to_budget(dedupe_overlaps(documents), query, budget)
+
+
+def compact_history(messages, budget: int = None):
+    """
+    Keeps the most recent turns that fit in `budget` tokens. Older turns are
+    replaced by one short note listing the last few questions asked, so
+    references to them still resolve without paying for the full answers.
+    """
+    budget = config.HISTORY_TOKEN_BUDGET if budget is None else budget
+    if not messages or sum(estimate_tokens(m.content) for m in messages) <= budget:
+        return messages
+
+    # A session summary (system message) is already compact; keep it as is
+    summary = [m for m in messages if isinstance(m, SystemMessage)]
+    messages = [m for m in messages if not isinstance(m, SystemMessage)]
+    budget -= sum(estimate_tokens(m.content) for m in summary)
+
+    kept = []
+    # Walk back a (human, ai) turn at a time so a turn is never split
+    turns = [messages[i:i + 2] for i in range(0, len(messages), 2)]
+    while turns and estimate_tokens("".join(m.content for m in turns[-1])) <= budget:
+        turn = turns.pop()
+        budget -= estimate_tokens("".join(m.content for m in turn))
+        kept[:0] = turn
+
+    if not kept and turns:
+        # Even the last turn is over budget: keep the question, shorten the answer
+        turn = turns.pop()
+        max_chars = max(0, budget * config.CHARS_PER_TOKEN - len(turn[0].content))
+        kept = [turn[0]] + [AIMessage(content=m.content[:max_chars]) for m in turn[1:]]
+
+    earlier = [m.content for turn in turns for m in turn if isinstance(m, HumanMessage)]
+    if not earlier:
+        return summary + kept
+    note = "Earlier in this conversation the user asked: " + " | ".join(q[:100] for q in earlier[-5:])
+    return summary + [SystemMessage(content=note)] + kept
+
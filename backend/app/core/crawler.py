@@ -0,0 +1,206 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+import httpx
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+from app.core import config
+
+_SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+class CrawlCache:
+    """
+    Remembers the ETag / Last-Modified validators of every fetched URL so a
+    re-crawl can send conditional requests and skip unchanged pages.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def validators(self, url: str):
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified FROM pages WHERE url = ?", (url,)).fetchone()
+        return row or (None, None)
+
+    def save(self, entries):
+        """entries: iterable of (url, etag, last_modified)."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+                [(url, etag, modified, time.time()) for url, etag, modified in entries],
+            )
+            self._conn.commit()
+
+    def forget(self, url: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _HostLimiter:
+    """Caps concurrent requests and spaces out request starts per host."""
+
+    def __init__(self, per_host: int, delay: float):
+        self._per_host = per_host
+        self._delay = delay
+        self._semaphores = {}
+        self._next_start = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, host: str):
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self._per_host))
+        await semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self._delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self, host: str):
+        self._semaphores[host].release()
+
+
+def extract_text(html: str):
+    """Returns (title, visible text) of an HTML page."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    lines = (line.strip() for line in soup.get_text(separator="\n").splitlines())
+    return title, "\n".join(line for line in lines if line)
+
+
+class Crawler:
+    """
+    Fetches many pages concurrently with one pooled async HTTP client,
+    honoring per-host limits and conditional requests. Use pages() from a
+    worker thread: it runs the crawl on its own event loop and yields
+    Documents through a bounded queue as soon as each page arrives.
+    """
+
+    def __init__(self, cache: CrawlCache = None, max_pages: int = None):
+        self.cache = cache
+        self.max_pages = max_pages or config.CRAWL_MAX_PAGES
+        self.fetched = 0
+        self.unchanged = 0
+        self.failed = 0
+        # Validators are only committed once the caller has stored the pages
+        self.pending_validators = []
+
+    async def _get(self, client, limiter, url, conditional=True):
+        headers = {}
+        if conditional and self.cache:
+            etag, modified = self.cache.validators(url)
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+        host = urlparse(url).netloc
+        await limiter.acquire(host)
+        try:
+            return await client.get(url, headers=headers)
+        finally:
+            limiter.release(host)
+
+    async def _sitemap_urls(self, client, limiter, sitemap_url, depth=0):
+        """Expands a sitemap (or sitemap index, up to 2 levels) into page URLs."""
+        response = await self._get(client, limiter, sitemap_url, conditional=False)
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        locs = [loc.text.strip() for loc in root.iter(f"{_SITEMAP_NS}loc") if loc.text]
+        if root.tag == f"{_SITEMAP_NS}sitemapindex" and depth < 2:
+            urls = []
+            for child in locs:
+                urls.extend(await self._sitemap_urls(client, limiter, child, depth + 1))
+                if len(urls) >= self.max_pages:
+                    break
+            return urls
+        return locs
+
+    async def _fetch_page(self, client, limiter, url, out):
+        try:
+            response = await self._get(client, limiter, url)
+            if response.status_code == 304:
+                self.unchanged += 1
+                return
+            response.raise_for_status()
+            title, text = extract_text(response.text)
+            self.fetched += 1
+            self.pending_validators.append(
+                (url, response.headers.get("etag"), response.headers.get("last-modified"))
+            )
+            if text:
+                await asyncio.to_thread(out.put, Document(page_content=text, metadata={"source": url, "title": title}))
+        except Exception as e:
+            self.failed += 1
+            print(f"Failed to fetch {url}: {e}")
+
+    async def _crawl(self, urls, sitemap, out):
+        limits = httpx.Limits(max_connections=config.CRAWL_CONCURRENCY, max_keepalive_connections=config.CRAWL_CONCURRENCY)
+        limiter = _HostLimiter(config.CRAWL_PER_HOST_CONCURRENCY, config.CRAWL_PER_HOST_DELAY_SECONDS)
+        async with httpx.AsyncClient(limits=limits, timeout=config.CRAWL_TIMEOUT_SECONDS, follow_redirects=True) as client:
+            targets = list(urls)
+            if sitemap:
+                targets.extend(await self._sitemap_urls(client, limiter, sitemap))
+            # Keep order, drop duplicates, respect the page cap
+            targets = list(dict.fromkeys(targets))[:self.max_pages]
+            await asyncio.gather(*[self._fetch_page(client, limiter, url, out) for url in targets])
+
+    def pages(self, urls=(), sitemap=None):
+        """Yields one Document per new or changed page, while the crawl runs."""
+        out = queue.Queue(maxsize=config.CRAWL_CONCURRENCY * 2)
+        done = object()
+        error = []
+
+        def run():
+            try:
+                asyncio.run(self._crawl(urls, sitemap, out))
+            except Exception as e:
+                error.append(e)
+            finally:
+                out.put(done)
+
+        thread = threading.Thread(target=run, name="crawler", daemon=True)
+        thread.start()
+        finished = False
+        try:
+            while True:
+                item = out.get()
+                if item is done:
+                    finished = True
+                    break
+                yield item
+        finally:
+            if not finished:
+                # The consumer stopped early; drain so the crawl thread can exit
+                threading.Thread(target=lambda: list(iter(out.get, done)), daemon=True).start()
+        thread.join()
+        if error:
+            raise error[0]
+
+    def commit(self):
+        """Records the validators of the pages fetched in this crawl."""
+        if self.cache and self.pending_validators:
+            self.cache.save(self.pending_validators)
+        self.pending_validators = []
@@ -0,0 +1,173 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from app.core import config
+from app.core.metrics import timed
+
+# Model loaded once per worker process by _init_worker
+_worker_embeddings = None
+
+
+def _init_worker(model_name: str, torch_threads: int):
+    global _worker_embeddings
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Split the cores between workers instead of every process using all of them
+    torch.set_num_threads(torch_threads)
+    _worker_embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'}
+    )
+
+
+def _embed_batch(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only loads the underlying model on first use (or
+    when warm_up() is called), so importing the app stays fast.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.model.embed_query(text)
+
+
+class EmbeddingEngine:
+    """
+    Embeds documents in fixed-size batches, either in-process or sharded
+    across a pool of worker processes. Batches are yielded in input order as
+    soon as they are ready, so callers can write each one to Chroma and keep
+    memory bounded to a few batches.
+    """
+
+    def __init__(self, embeddings, batch_size: int = 64, workers: int = 1, model_name: str = None, cache=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.model_name = model_name or config.EMBEDDING_MODEL_NAME
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"Starting {self.workers} embedding worker processes ({torch_threads} threads each)...")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                # spawn, not fork: forking a process that already holds torch threads can deadlock
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, torch_threads),
+            )
+        return self._pool
+
+    def _batches(self, documents):
+        iterator = iter(documents)
+        while True:
+            batch = list(itertools.islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _lookup(self, batch):
+        """Splits a batch into cached vectors and the texts still to embed."""
+        texts = [doc.page_content for doc in batch]
+        cached = self.cache.get_many(texts) if self.cache else {}
+        missing = [i for i in range(len(texts)) if i not in cached]
+        return texts, cached, missing
+
+    def _merge(self, texts, cached, missing, new_vectors):
+        if self.cache and missing:
+            self.cache.put_many([texts[i] for i in missing], new_vectors)
+        vectors = [None] * len(texts)
+        for i, vector in cached.items():
+            vectors[i] = vector
+        for i, vector in zip(missing, new_vectors):
+            vectors[i] = vector
+        return vectors
+
+    def embed_batches(self, documents):
+        """
+        Yields (batch_of_documents, vectors) pairs. `documents` may be any
+        iterable, including a generator producing chunks lazily. Chunks found
+        in the embedding cache are not sent to the model.
+        """
+        if self.workers == 1:
+            for batch in self._batches(documents):
+                with timed("embed"):
+                    texts, cached, missing = self._lookup(batch)
+                    new_vectors = self.embeddings.embed_documents([texts[i] for i in missing]) if missing else []
+                    vectors = self._merge(texts, cached, missing, new_vectors)
+                yield batch, vectors
+            return
+
+        pool = self._get_pool()
+        # Keep every worker busy plus one batch queued each, no more
+        in_flight = deque()
+
+        def finish():
+            batch, texts, cached, missing, future = in_flight.popleft()
+            with timed("embed"):
+                new_vectors = future.result() if future else []
+                return batch, self._merge(texts, cached, missing, new_vectors)
+
+        for batch in self._batches(documents):
+            with timed("embed"):
+                texts, cached, missing = self._lookup(batch)
+                future = pool.submit(_embed_batch, [texts[i] for i in missing]) if missing else None
+            in_flight.append((batch, texts, cached, missing, future))
+            if len(in_flight) >= self.workers * 2:
+                yield finish()
+        while in_flight:
+            yield finish()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class Throughput:
+    """Small helper to report chunks/sec for an ingest."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+
+    def add(self, n: int):
+        self.count += n
+
+    @property
+    def per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so trivially re-flowed chunks hash the same."""
+    return " ".join(text.split())
+
+
+def content_hash(*parts: str) -> str:
+    """sha256 over the normalized parts, used for cache keys and chunk ids."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_text(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of embeddings keyed by a hash of the model name
+    and the normalized chunk text. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.model_name = model_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return content_hash(self.model_name, text)
+
+    def get_many(self, texts):
+        """Returns {index: vector} for the texts that are already cached."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+        result = {}
+        for i, key in enumerate(keys):
+            if key in found:
+                result[i] = array("f", found[key]).tolist()
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, texts, vectors):
+        rows = [(self.key(text), array("f", vector).tobytes()) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
@@ -0,0 +1,41 @@
+def build_where(filters):
+    """
+    Chroma `where` clause for a chat's metadata filters, or None when none
+    are set. `filters` holds any of: sources, file_types (lists, any value
+    matches), columns ({CSV column: value or list of values}) and
+    ingested_after / ingested_before (epoch seconds).
+    """
+    if not filters:
+        return None
+    clauses = []
+    if filters.get("sources"):
+        clauses.append({"source": {"$in": list(filters["sources"])}})
+    if filters.get("file_types"):
+        clauses.append({"file_type": {"$in": [t.lower() for t in filters["file_types"]]}})
+    for column, value in (filters.get("columns") or {}).items():
+        clauses.append({column: {"$in": list(value)} if isinstance(value, (list, tuple)) else value})
+    if filters.get("ingested_after") is not None:
+        clauses.append({"ingested_at": {"$gte": int(filters["ingested_after"])}})
+    if filters.get("ingested_before") is not None:
+        clauses.append({"ingested_at": {"$lte": int(filters["ingested_before"])}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def structured_tables(filters, structured_store):
+    """
+    Names of the CSV tables the SQL path may read under these filters, or []
+    when it must not answer. Column and date filters cannot be applied to
+    generated SQL, so they send the question to vector search.
+    """
+    if filters:
+        if filters.get("columns") or filters.get("ingested_after") is not None \
+                or filters.get("ingested_before") is not None:
+            return []
+        if filters.get("file_types") and "csv" not in [t.lower() for t in filters["file_types"]]:
+            return []
+    tables = structured_store.tables()
+    if filters and filters.get("sources"):
+        tables = [table for table in tables if table["source"] in filters["sources"]]
+    return [table["name"] for table in tables]
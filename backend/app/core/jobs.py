@@ -0,0 +1,129 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.core import config, metrics
+from app.core.concurrency import ingest_executor
+
+
+@dataclass
+class IngestJob:
+    """Status of one background ingestion (PDF, CSV or website)."""
+    kind: str
+    target: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"      # queued -> running -> completed | failed
+    stage: str = "queued"       # free-form pipeline stage reported by the ingest function
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_skipped: int = 0
+    # Chunks deleted because their source no longer contains them
+    chunks_removed: int = 0
+    error: Optional[str] = None
+    timings: Optional[metrics.Timings] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def report(self, stage: str, chunks_total: Optional[int] = None, chunks_embedded: Optional[int] = None,
+               chunks_skipped: Optional[int] = None, chunks_removed: Optional[int] = None):
+        """Progress callback handed to the ingest functions."""
+        self.stage = stage
+        if chunks_total is not None:
+            self.chunks_total = chunks_total
+        if chunks_embedded is not None:
+            self.chunks_embedded = chunks_embedded
+        if chunks_skipped is not None:
+            self.chunks_skipped = chunks_skipped
+        if chunks_removed is not None:
+            self.chunks_removed = chunks_removed
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "target": self.target,
+            "status": self.status,
+            "stage": self.stage,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_removed": self.chunks_removed,
+            "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else None,
+            "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None,
+            "error": self.error,
+            "timings": self.timings.to_dict() if self.timings else None,
+            "created_at": self.created_at,
+        }
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on their own pool and keeps the most recent
+    ones in memory so their status can be polled.
+    """
+
+    def __init__(self, executor, max_jobs: int = 500):
+        self._executor = executor
+        self._max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, target: str, func, *args, cleanup=None) -> IngestJob:
+        """
+        Queues func(*args, progress=job.report). `cleanup` always runs after
+        the job, e.g. to delete the uploaded temp file.
+        """
+        job = IngestJob(kind=kind, target=target)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        self._executor.submit(self._run, job, func, args, cleanup)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job: IngestJob, func, args, cleanup):
+        job.status = "running"
+        job.started_at = time.time()
+        job.timings = metrics.Timings()
+        try:
+            with metrics.tracking(job.timings):
+                func(*args, progress=job.report)
+            job.status = "completed"
+            job.stage = "completed"
+        except Exception as e:
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            metrics.observe_ingest(job.kind, job.timings)
+            if cleanup:
+                cleanup()
+
+    def _evict_finished(self):
+        # Drop the oldest finished jobs once we keep more than max_jobs
+        if len(self._jobs) <= self._max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self._max_jobs:
+                break
+            if self._jobs[job_id].status in ("completed", "failed"):
+                del self._jobs[job_id]
+
+
+job_manager = JobManager(ingest_executor, max_jobs=config.MAX_TRACKED_JOBS)
@@ -0,0 +1,551 @@
+import asyncio
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from langchain_community.vectorstores import Chroma
+
+from app.core import config
+from app.core.concurrency import request_executor, run_blocking
+from app.core.embedding import Throughput
+from app.core.crawler import CrawlCache
+from app.core.embedding_cache import content_hash
+from app.core.lexical_index import LexicalIndex
+from app.core.metrics import timed
+from app.core.retrieval import HybridRetriever
+from app.core.source_registry import SourceRegistry, source_kind
+from app.core.structured_store import StructuredStore
+
+
+def _report(progress, stage, **counts):
+    if progress:
+        progress(stage, **counts)
+
+
+def chunk_id(doc) -> str:
+    """
+    Content-addressed id for a chunk: the same text from the same source
+    always maps to the same id, so re-ingesting a document cannot store a
+    chunk twice. Chunks built with their own id (CSV rows) keep it.
+    """
+    return doc.id or content_hash(str(doc.metadata.get("source", "")), doc.page_content)
+
+
+class KnowledgeBaseState:
+    """
+    One generation of a knowledge base: a Chroma collection plus its lexical
+    index, CSV tables, source registry, retriever and chain. The chain is built once; it sees
+    new chunks because the retriever reads the live collection and index.
+    Readers hold a reference while they use it, so a reset can swap in a new
+    generation without pulling the old one from under in-flight chats.
+    """
+
+    def __init__(self, collection_name, collection, vectorstore, lexical_index, structured_store, crawl_cache,
+                 source_registry=None):
+        self.collection_name = collection_name
+        self.collection = collection
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.structured_store = structured_store
+        self.crawl_cache = crawl_cache
+        self.source_registry = source_registry
+        self.retriever = None
+        self.chain = None
+        self.answer_cache = None
+        self.has_documents = collection.count() > 0 or bool(structured_store.tables())
+        self.readers = 0
+        self.retired = False
+
+
+class KnowledgeBase:
+    """
+    Owns the vector store, indexes and chain for one named collection.
+
+    Chats and ingests work on a snapshot() of the current state. reset()
+    builds a fresh generation in a new collection, swaps it in atomically and
+    drops the old one once its last reader is done, so a reset never fails
+    or stalls a chat that is in flight.
+    """
+
+    def __init__(self, name, client_factory, embeddings, embedding_engine, build_chain, answer_cache,
+                 data_dir=None):
+        self.name = name
+        self._client_factory = client_factory
+        self._embeddings = embeddings
+        self._embedding_engine = embedding_engine
+        self._build_chain = build_chain
+        self.answer_cache = answer_cache
+        self._data_dir = data_dir or config.KNOWLEDGE_BASE_DIR
+        self._state = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._reset_lock = threading.Lock()
+        self.last_used = time.time()
+
+    # --- State management ---
+
+    def _collection_name(self, generation: int) -> str:
+        return self.name if generation == 0 else f"{self.name}_v{generation}"
+
+    def _discover_generations(self, client):
+        pattern = re.compile(rf"^{re.escape(self.name)}(?:_v(\d+))?$")
+        generations = []
+        for collection in client.list_collections():
+            match = pattern.match(getattr(collection, "name", collection))
+            if match:
+                generations.append(int(match.group(1) or 0))
+        return sorted(generations)
+
+    def _paths(self, collection_name):
+        return (
+            os.path.join(self._data_dir, f"{collection_name}.lexical.sqlite"),
+            os.path.join(self._data_dir, f"{collection_name}.structured.sqlite"),
+            os.path.join(self._data_dir, f"{collection_name}.crawl.sqlite"),
+            os.path.join(self._data_dir, f"{collection_name}.sources.sqlite"),
+        )
+
+    @staticmethod
+    def _hnsw_configuration():
+        return {"hnsw": {
+            "max_neighbors": config.HNSW_M,
+            "ef_construction": config.HNSW_EF_CONSTRUCTION,
+            "ef_search": config.HNSW_EF_SEARCH,
+        }}
+
+    @staticmethod
+    def _apply_ef_search(collection):
+        # M and ef_construction are fixed when a collection is created;
+        # ef_search can be changed on an existing one
+        try:
+            current = (collection.configuration or {}).get("hnsw", {}).get("ef_search")
+            if current != config.HNSW_EF_SEARCH:
+                collection.modify(configuration={"hnsw": {"ef_search": config.HNSW_EF_SEARCH}})
+        except Exception as e:
+            print(f"Could not update ef_search on '{collection.name}': {e}")
+
+    def _backfill_lexical(self, collection, lexical_index, page_size=1000):
+        """
+        Indexes the chunks already in a collection for BM25 when hybrid
+        retrieval is first enabled, or rebuilds the index if chunks were
+        stored while it was off.
+        """
+        print(f"Building the lexical index for '{collection.name}'...")
+        lexical_index.clear()
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            lexical_index.add(page["ids"], [text or "" for text in page["documents"]])
+            offset += len(page["ids"])
+        print(f"✅ Indexed {offset} chunks for keyword search.")
+
+    def _backfill_sources(self, collection, source_registry, page_size=1000):
+        """Registers the chunks of collections created before the source registry existed."""
+        print(f"Building the source registry for '{collection.name}'...")
+        chunk_ids = {}
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                chunk_ids.setdefault((metadata or {}).get("source", ""), set()).add(doc_id)
+            offset += len(page["ids"])
+        # No content hash: the next ingest of each source re-checks every chunk
+        for source, ids in chunk_ids.items():
+            source_registry.put(source, source_kind(source), None, ids)
+        print(f"✅ Registered {len(chunk_ids)} sources.")
+
+    def _open(self, generation: int) -> KnowledgeBaseState:
+        client = self._client_factory()
+        collection_name = self._collection_name(generation)
+        collection = client.get_or_create_collection(
+            collection_name, embedding_function=None, configuration=self._hnsw_configuration(),
+        )
+        self._apply_ef_search(collection)
+        vectorstore = Chroma(
+            client=client,
+            collection_name=collection_name,
+            embedding_function=self._embeddings,
+        )
+        lexical_path, structured_path, crawl_path, sources_path = self._paths(collection_name)
+        lexical_index = None
+        if config.HYBRID_RETRIEVAL:
+            lexical_index = LexicalIndex(lexical_path)
+            if len(lexical_index) != collection.count():
+                self._backfill_lexical(collection, lexical_index)
+        source_registry = SourceRegistry(sources_path)
+        if not len(source_registry) and collection.count():
+            self._backfill_sources(collection, source_registry)
+        state = KnowledgeBaseState(
+            collection_name, collection, vectorstore, lexical_index,
+            StructuredStore(structured_path), CrawlCache(crawl_path), source_registry,
+        )
+        state.retriever = self._make_retriever(state)
+        state.chain = self._build_chain(state.retriever, state.structured_store)
+        return state
+
+    def _make_retriever(self, state):
+        # With a reranker the retriever only proposes candidates; the chain keeps the best few
+        k = config.RERANK_CANDIDATES if config.RERANK_MODEL else config.RETRIEVAL_K
+        # Also used for plain dense search so it records the same timed stages;
+        # with nothing to fuse, fetching more than k would be wasted
+        fused = state.lexical_index is not None
+        return HybridRetriever(
+            vectorstore=state.vectorstore,
+            collection=state.collection,
+            lexical_index=state.lexical_index,
+            k=k,
+            fetch_k=max(config.RETRIEVAL_FETCH_K, k) if fused else k,
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    def _load(self) -> KnowledgeBaseState:
+        # Caller holds self._lock
+        self.last_used = time.time()
+        if self._state is None:
+            generations = self._discover_generations(self._client_factory())
+            self._generation = generations[-1] if generations else 0
+            self._state = self._open(self._generation)
+            self._state.answer_cache = self.answer_cache
+            # Leftovers from a reset interrupted before cleanup
+            for stale in generations[:-1]:
+                self._drop(self._collection_name(stale), None)
+        return self._state
+
+    def current(self) -> KnowledgeBaseState:
+        """Returns the live state, opening the newest generation on first use."""
+        with self._lock:
+            return self._load()
+
+    def _pin(self) -> KnowledgeBaseState:
+        with self._lock:
+            # Loaded and pinned under one lock so unload() cannot close it in between
+            state = self._load()
+            state.readers += 1
+        return state
+
+    def _release(self, state):
+        with self._lock:
+            state.readers -= 1
+            drop = state.retired and state.readers == 0
+        if drop:
+            self._drop(state.collection_name, state)
+
+    @contextmanager
+    def snapshot(self):
+        """Pins the current state for the duration of a chat or ingest."""
+        state = self._pin()
+        try:
+            yield state
+        finally:
+            self._release(state)
+
+    @asynccontextmanager
+    async def asnapshot(self):
+        """
+        snapshot() for the event loop. Pinning may open the collection and
+        the last release of a retired state deletes its files, so both run
+        in the request pool; a cancelled chat still releases its pin.
+        """
+        pin = asyncio.ensure_future(run_blocking(self._pin))
+        try:
+            state = await asyncio.shield(pin)
+        except asyncio.CancelledError:
+            def release_late(done):
+                if not done.cancelled() and done.exception() is None:
+                    request_executor.submit(self._release, done.result())
+            pin.add_done_callback(release_late)
+            raise
+        try:
+            yield state
+        finally:
+            await asyncio.shield(run_blocking(self._release, state))
+
+    def unload(self) -> bool:
+        """
+        Frees the in-memory state (indexes, chain, answer cache) if nothing is
+        using it. The data stays on disk; the next request reopens it.
+        """
+        if not self._reset_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                state = self._state
+                if state is None or state.readers:
+                    return False
+                self._state = None
+            self._close(state)
+            self.answer_cache.clear()
+            return True
+        finally:
+            self._reset_lock.release()
+
+    @staticmethod
+    def _close(state):
+        if state.lexical_index is not None:
+            state.lexical_index.close()
+        state.structured_store.close()
+        state.crawl_cache.close()
+        state.source_registry.close()
+
+    def _drop(self, collection_name, state):
+        if state is not None:
+            self._close(state)
+        try:
+            self._client_factory().delete_collection(collection_name)
+        except Exception as e:
+            print(f"Could not delete collection '{collection_name}': {e}")
+        for path in self._paths(collection_name):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        print(f"🗑️ Dropped retired collection '{collection_name}'.")
+
+    def reset(self):
+        """Swaps in an empty generation; the old one is dropped when unused."""
+        with self._reset_lock:
+            self.current()
+            fresh = self._open(self._generation + 1)
+            fresh.answer_cache = self.answer_cache
+            with self._lock:
+                old, self._state = self._state, fresh
+                self._generation += 1
+                old.retired = True
+                drop = old.readers == 0
+            self.answer_cache.clear()
+            if drop:
+                self._drop(old.collection_name, old)
+
+    def rebuild_chain(self):
+        """Rebuilds the chain on the current state (e.g. after an LLM swap)."""
+        state = self.current()
+        # Assignment is atomic; chats that already read the old chain finish with it
+        state.chain = self._build_chain(state.retriever, state.structured_store)
+        self.answer_cache.clear()
+
+    # --- Writes ---
+
+    def _new_chunks(self, texts, collection, skipped):
+        """
+        Yields only the chunks whose id is not already in the collection (or
+        earlier in this ingest), counting the others in skipped[0].
+        """
+        seen = set()
+        iterator = iter(texts)
+        while True:
+            batch = list(itertools.islice(iterator, config.EMBED_BATCH_SIZE))
+            if not batch:
+                return
+            ids = [chunk_id(doc) for doc in batch]
+            with timed("dedupe"):
+                existing = set(collection.get(ids=ids, include=[])["ids"])
+            for doc, doc_id in zip(batch, ids):
+                if doc_id in existing or doc_id in seen:
+                    skipped[0] += 1
+                    continue
+                seen.add(doc_id)
+                doc.id = doc_id
+                yield doc
+
+    def store_documents(self, state, texts, progress=None):
+        """
+        Embeds the chunks batch by batch and writes each batch to the state's
+        collection and lexical index as soon as it is ready, so memory stays
+        bounded to a few batches. `texts` may be a generator (e.g. chunks of
+        a PDF produced page by page). Chunks already stored are skipped and
+        embeddings seen before come from the cache. The chain is not rebuilt:
+        new chunks are searchable as soon as their batch is written.
+        """
+        throughput = Throughput()
+        skipped = [0]
+        if hasattr(texts, "__len__"):
+            _report(progress, "embedding", chunks_total=len(texts), chunks_embedded=0)
+        for batch, vectors in self._embedding_engine.embed_batches(self._new_chunks(texts, state.collection, skipped)):
+            with timed("write"):
+                state.collection.upsert(
+                    ids=[doc.id for doc in batch],
+                    embeddings=vectors,
+                    documents=[doc.page_content for doc in batch],
+                    metadatas=[doc.metadata for doc in batch],
+                )
+                if state.lexical_index is not None:
+                    state.lexical_index.add([doc.id for doc in batch], [doc.page_content for doc in batch])
+            state.has_documents = True
+            # Cached answers may be stale now that the knowledge base changed
+            self.answer_cache.clear()
+            throughput.add(len(batch))
+            _report(progress, "embedding", chunks_embedded=throughput.count, chunks_skipped=skipped[0])
+        _report(progress, "embedding", chunks_skipped=skipped[0])
+        print(f"Embedded {throughput.count} chunks at {throughput.per_second:.1f} chunks/sec "
+              f"({skipped[0]} duplicate chunks skipped).")
+
+    def sync_sources(self, state, kind, texts, content_hashes, progress=None):
+        """
+        Stores the chunks of one or more sources and then removes the chunks
+        those sources had before that were not produced again, so each
+        source ends up with exactly its current chunks. Unchanged chunks are
+        neither embedded nor rewritten. `content_hashes` maps each source
+        to the hash of its content; it may be filled while `texts` is
+        consumed (websites hash each page as it arrives).
+        """
+        chunk_ids = {}
+        ingested_at = int(time.time())
+
+        def track(doc):
+            # Filterable at chat time (see filters.build_where)
+            doc.metadata["file_type"] = kind
+            doc.metadata["ingested_at"] = ingested_at
+            chunk_ids.setdefault(doc.metadata.get("source", ""), set()).add(chunk_id(doc))
+            return doc
+
+        if hasattr(texts, "__len__"):
+            texts = [track(doc) for doc in texts]
+        else:
+            texts = (track(doc) for doc in texts)
+        self.store_documents(state, texts, progress)
+
+        removed = 0
+        for source in set(content_hashes) | set(chunk_ids):
+            ids = chunk_ids.get(source, set())
+            stale = state.source_registry.chunk_ids(source) - ids
+            self._delete_chunks(state, stale)
+            removed += len(stale)
+            state.source_registry.put(source, kind, content_hashes.get(source), ids)
+        _report(progress, "cleanup", chunks_removed=removed)
+        if removed:
+            print(f"Removed {removed} chunks no longer in their source.")
+
+    def _delete_chunks(self, state, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with timed("delete"):
+            state.collection.delete(ids=ids)
+            if state.lexical_index is not None:
+                state.lexical_index.remove(ids)
+        self.answer_cache.clear()
+
+    def delete_source(self, source: str) -> bool:
+        """Removes one source's chunks, CSV table and crawl validators. False if unknown."""
+        with self.snapshot() as state:
+            if state.source_registry.get(source) is None:
+                return False
+            self._delete_chunks(state, state.source_registry.chunk_ids(source))
+            table = state.structured_store.table_for_source(source)
+            if table:
+                state.structured_store.drop_table(table["name"])
+            state.crawl_cache.forget(source)
+            state.source_registry.delete(source)
+            state.has_documents = state.collection.count() > 0 or bool(state.structured_store.tables())
+            self.answer_cache.clear()
+        print(f"🗑️ Deleted source '{source}' from '{self.name}'.")
+        return True
+
+
+class KnowledgeBaseRegistry:
+    """
+    Named knowledge bases, one per tenant, each with its own collections,
+    indexes, answer cache and chain, so a search only scans that tenant's
+    chunks and a reset only drops that tenant's data.
+
+    Knowledge bases other than the default one must be created with
+    create(); get() refuses names that have no collection in Chroma, so a
+    typo or a made-up name cannot spawn one. Beyond `max_loaded`, or after
+    `idle_seconds` without a request, the least recently used are unloaded
+    (their data stays on disk); pinned names are never unloaded.
+    """
+
+    # Chroma allows 63 characters and reset() appends _v<n>, so names stop at 56
+    _NAME_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,54}[a-zA-Z0-9]$")
+    # Reserved for the collection generations created by reset()
+    _GENERATION_RE = re.compile(r"_v\d+$")
+
+    def __init__(self, factory, client_factory, default_name, max_loaded: int = 8, idle_seconds: float = 900):
+        self._factory = factory
+        self._client_factory = client_factory
+        self.default_name = default_name
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self._knowledge_bases = {}
+        self._pinned = {default_name}
+        self._lock = threading.Lock()
+
+    def validate(self, name: str):
+        if not self._NAME_RE.match(name) or self._GENERATION_RE.search(name):
+            raise ValueError(
+                f"Invalid knowledge base name '{name}': use 3-56 letters, digits, '.', '_' or '-', "
+                "starting and ending with a letter or digit, and not ending in _v<number>."
+            )
+
+    def get(self, name: str = None) -> KnowledgeBase:
+        """
+        Returns the named knowledge base (the default one for None). Raises
+        ValueError for an invalid name and LookupError for one never created.
+        """
+        name = name or self.default_name
+        with self._lock:
+            knowledge_base = self._knowledge_bases.get(name)
+        if knowledge_base is None:
+            self.validate(name)
+            if name != self.default_name and not self._exists(name):
+                raise LookupError(f"Knowledge base '{name}' does not exist.")
+            with self._lock:
+                knowledge_base = self._knowledge_bases.get(name)
+                if knowledge_base is None:
+                    knowledge_base = self._knowledge_bases[name] = self._factory(name)
+        knowledge_base.last_used = time.time()
+        self.evict_idle()
+        return knowledge_base
+
+    def create(self, name: str) -> KnowledgeBase:
+        """Creates a knowledge base and its (empty) collection; ValueError if the name is invalid or taken."""
+        self.validate(name)
+        with self._lock:
+            if name in self._knowledge_bases or name == self.default_name or self._exists(name):
+                raise ValueError(f"Knowledge base '{name}' already exists.")
+            knowledge_base = self._knowledge_bases[name] = self._factory(name)
+        # Opening it creates the collection, so the name survives a restart
+        knowledge_base.current()
+        knowledge_base.last_used = time.time()
+        self.evict_idle()
+        return knowledge_base
+
+    def _exists(self, name: str) -> bool:
+        """Whether Chroma has a collection (of any generation) for this name."""
+        return any(self._GENERATION_RE.sub("", getattr(collection, "name", collection)) == name
+                   for collection in self._client_factory().list_collections())
+
+    def loaded(self):
+        with self._lock:
+            return [kb for kb in self._knowledge_bases.values() if kb.loaded]
+
+    def names(self):
+        """Every knowledge base with data in Chroma plus those created since startup."""
+        names = set(self._knowledge_bases)
+        for collection in self._client_factory().list_collections():
+            name = self._GENERATION_RE.sub("", getattr(collection, "name", collection))
+            if self._NAME_RE.match(name):
+                names.add(name)
+        return sorted(names)
+
+    def evict_idle(self):
+        """Unloads idle knowledge bases and the least recently used beyond max_loaded."""
+        now = time.time()
+        candidates = sorted(
+            (kb for kb in self.loaded() if kb.name not in self._pinned),
+            key=lambda kb: kb.last_used,
+        )
+        excess = len(candidates) + 1 - self.max_loaded
+        for kb in candidates:
+            if excess > 0 or now - kb.last_used > self.idle_seconds:
+                if kb.unload():
+                    excess -= 1
+                    print(f"💤 Unloaded idle knowledge base '{kb.name}'.")
@@ -0,0 +1,206 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Very common words carry no ranking signal and have the longest posting lists
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or "
+    "that the this to was what when where which who why will with".split()
+)
+
+
+def tokenize(text: str):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index stored in SQLite. Documents are added and removed
+    incrementally as chunks are ingested, so the index never has to be
+    rebuilt from the whole corpus, and nothing but two counters is read when
+    it opens.
+
+    Postings are impact-ordered: each (term, chunk) stores its BM25 term
+    frequency weight, normalized by the average chunk length at the time the
+    chunk was indexed, and a term's postings are read best first. A query
+    reads a page at a time from the list that could still add the most,
+    looks up the other terms' impacts of each new chunk that could reach the
+    k-th best, and stops once no unseen chunk can beat it (the threshold
+    algorithm). Terms found in most chunks give near-tied scores that take a
+    long walk to settle, so at most `max_scored` chunks are looked up and the
+    best of those returned.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, page_size: int = 64, max_scored: int = 2000):
+        self.k1 = k1
+        self.b = b
+        self.page_size = page_size
+        self.max_scored = max_scored
+        self._lock = threading.RLock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Lookups land on random pages; mapping the file skips a read() copy for each
+        self._conn.execute(f"PRAGMA mmap_size={1 << 30}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, impact REAL NOT NULL, doc INTEGER NOT NULL, "
+            "PRIMARY KEY (term, impact DESC, doc)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc)")
+        self._conn.commit()
+        self._n_docs, self._total_len = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+
+    def __len__(self):
+        return self._n_docs
+
+    def add(self, ids, texts):
+        """Indexes new documents; ids already present are replaced."""
+        with self._lock:
+            self._remove(ids)
+            counts = [Counter(tokenize(text)) for text in texts]
+            lengths = [sum(c.values()) for c in counts]
+            self._n_docs += len(lengths)
+            self._total_len += sum(lengths)
+            avg_len = self._total_len / self._n_docs if self._n_docs else 1.0
+            cursor = self._conn.cursor()
+            posting_rows, df = [], Counter()
+            for doc_id, terms, length in zip(ids, counts, lengths):
+                cursor.execute("INSERT INTO docs (id, length) VALUES (?, ?)", (doc_id, length))
+                doc = cursor.lastrowid
+                norm = self.k1 * (1 - self.b + self.b * length / (avg_len or 1.0))
+                for term, tf in terms.items():
+                    posting_rows.append((term, tf * (self.k1 + 1) / (tf + norm), doc))
+                df.update(terms.keys())
+            cursor.executemany("INSERT INTO postings (term, impact, doc) VALUES (?, ?, ?)", posting_rows)
+            cursor.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                df.items(),
+            )
+            self._conn.commit()
+
+    def remove(self, ids):
+        with self._lock:
+            self._remove(ids)
+            self._conn.commit()
+
+    def _remove(self, ids):
+        df = Counter()
+        for doc_id in ids:
+            row = self._conn.execute("SELECT doc, length FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            doc, length = row
+            df.update(term for term, in self._conn.execute("SELECT term FROM postings WHERE doc = ?", (doc,)))
+            self._conn.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+            self._conn.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+            self._n_docs -= 1
+            self._total_len -= length
+        if df:
+            self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in df.items()])
+            self._conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0", [(term,) for term in df])
+
+    def clear(self):
+        with self._lock:
+            self._n_docs = 0
+            self._total_len = 0
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def search(self, query: str, k: int = 20):
+        """Returns up to k (doc_id, bm25 score) pairs, best first."""
+        with self._lock:
+            if not self._n_docs:
+                return []
+            idf = {}
+            for term in set(tokenize(query)):
+                row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row:
+                    idf[term] = self._idf(row[0])
+            # term -> [cursor over its postings best first, upper bound of any unread posting]
+            lists = {
+                term: [self._conn.execute(
+                    "SELECT doc, impact FROM postings WHERE term = ? ORDER BY impact DESC, doc", (term,)
+                ), weight * (self.k1 + 1)]
+                for term, weight in idf.items()
+            }
+            scored, top, looked_up = set(), [], 0
+            try:
+                # One page of every list first, then always the list whose unread
+                # postings could still add the most
+                order = list(lists)
+                while lists:
+                    term = order.pop() if order else max(lists, key=lambda t: lists[t][1])
+                    cursor = lists[term][0]
+                    rows = cursor.fetchmany(self.page_size)
+                    if len(rows) < self.page_size:
+                        cursor.close()
+                        del lists[term]
+                    else:
+                        lists[term][1] = idf[term] * rows[-1][1]
+                    # doc -> this term's share of the score, for chunks seen for the first time
+                    seen = {doc: idf[term] * impact for doc, impact in rows if doc not in scored}
+                    scored.update(seen)
+                    if len(top) == k:
+                        # Skip lookups for chunks that cannot reach the k-th best even
+                        # with the largest unread impact of every other term
+                        others = sum(bound for t, (_, bound) in lists.items() if t != term)
+                        seen = {doc: score for doc, score in seen.items() if score + others > top[0][0]}
+                    rest = self._score(list(seen), {t: weight for t, weight in idf.items() if t != term})
+                    looked_up += len(seen)
+                    for doc, score in seen.items():
+                        self._push(top, k, score + rest[doc], doc)
+                    # No unseen chunk can score more than the sum of the lists' bounds
+                    if len(top) == k and top[0][0] >= sum(bound for _, bound in lists.values()):
+                        break
+                    if looked_up >= self.max_scored:
+                        break
+            finally:
+                for cursor, _ in lists.values():
+                    cursor.close()
+            top.sort(reverse=True)
+            marks = ",".join("?" * len(top))
+            names = dict(self._conn.execute(f"SELECT doc, id FROM docs WHERE doc IN ({marks})", [doc for _, doc in top]))
+            return [(names[doc], score) for score, doc in top]
+
+    @staticmethod
+    def _push(top, k, score, doc):
+        if len(top) < k:
+            heapq.heappush(top, (score, doc))
+        elif score > top[0][0]:
+            heapq.heapreplace(top, (score, doc))
+
+    def _idf(self, df):
+        return math.log(1 + (self._n_docs - df + 0.5) / (df + 0.5))
+
+    def _score(self, docs, weights):
+        """sum(weight * impact) over the given {term: weight} for each chunk, in one lookup."""
+        scores = dict.fromkeys(docs, 0.0)
+        if not docs or not weights:
+            return scores
+        cases = " ".join("WHEN ? THEN ?" for _ in weights)
+        for doc, score in self._conn.execute(
+            f"SELECT doc, SUM(impact * CASE term {cases} END) FROM postings "
+            f"WHERE doc IN ({','.join('?' * len(docs))}) AND term IN ({','.join('?' * len(weights))}) GROUP BY doc",
+            [*(value for item in weights.items() for value in item), *docs, *weights],
+        ):
+            scores[doc] = score
+        return scores
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from contextlib import suppress
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import httpx
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.outputs import GenerationChunk, LLMResult
+
+from app.core import config
+from app.core.metrics import timed
+
+# Requests waiting with the same key (the knowledge base) share one place in
+# the round-robin, so one tenant's burst cannot starve the others
+_queue_key = ContextVar("llm_queue_key", default=None)
+
+# Failures before anything was generated; safe to retry on another instance
+_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class GatewayBusy(Exception):
+    """The generation queue is full; the caller should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"The LLM is busy, retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def queue_key(key):
+    """Queues the LLM calls made in this context under `key`."""
+    token = _queue_key.set(key)
+    try:
+        yield
+    finally:
+        _queue_key.reset(token)
+
+
+class OllamaInstance:
+    def __init__(self, base_url: str, max_in_flight: int):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.served = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def to_dict(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "failures": self.failures,
+            "available": self.available,
+        }
+
+
+class LLMGateway:
+    """
+    Single front door to one or more Ollama servers. HTTP connections are
+    pooled and kept alive; each instance runs at most `max_in_flight`
+    generations and new ones go to the least busy instance. The rest wait in
+    a queue served round-robin across queue keys. Once `max_queue` requests
+    are waiting, new ones fail fast with GatewayBusy instead of slowing every
+    generation down. An instance that refuses connections is skipped for
+    `cooldown_seconds` and the request is retried on another one.
+
+    Only async calls are queued; sync calls (scripts, evaluation) go straight
+    to the least busy instance but still count towards its in-flight
+    generations.
+    """
+
+    def __init__(self, base_urls, max_in_flight: int = 4, max_queue: int = 32, timeout: float = 120,
+                 connect_timeout: float = 5, cooldown_seconds: float = 10):
+        self.instances = [OllamaInstance(url, max_in_flight) for url in base_urls]
+        self.max_queue = max_queue
+        self.cooldown_seconds = cooldown_seconds
+        self.rejected = 0
+        self._waiters = OrderedDict()   # queue key -> deque of futures
+        self._queued = 0
+        self._avg_seconds = 5.0         # moving average of a generation, for Retry-After
+        slots = max_in_flight * len(self.instances)
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=slots + 4, max_keepalive_connections=slots)
+        self._client = None
+        self._client_loop = None
+        self._sync_client = None
+        # in_flight is also changed from the threads making sync calls
+        self._count_lock = threading.Lock()
+        self._waiter_loop = None        # loop of the queued requests, for sync calls to wake them
+
+    # --- Scheduling ---
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _pick(self):
+        instances = [i for i in self.instances if i.available] or self.instances
+        free = [i for i in instances if i.in_flight < i.max_in_flight]
+        return min(free, key=lambda i: i.in_flight / i.max_in_flight) if free else None
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead has likely drained."""
+        slots = sum(i.max_in_flight for i in self.instances)
+        return max(1, math.ceil((self._queued + 1) / slots * self._avg_seconds))
+
+    def check_admission(self):
+        """Raises GatewayBusy if the queue is full; lets routes refuse work before doing any."""
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise GatewayBusy(self.retry_after())
+
+    async def _acquire(self) -> OllamaInstance:
+        instance = None if self._queued else self._pick()
+        if instance is not None:
+            self._add_in_flight(instance, 1)
+            return instance
+        self.check_admission()
+        key = _queue_key.get()
+        self._waiter_loop = asyncio.get_running_loop()
+        future = self._waiter_loop.create_future()
+        waiters = self._waiters.setdefault(key, deque())
+        waiters.append(future)
+        self._queued += 1
+        try:
+            with timed("llm_queue"):
+                return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as the request was cancelled
+                self._release(future.result(), None)
+            elif future in waiters:
+                waiters.remove(future)
+                self._queued -= 1
+                if not waiters and self._waiters.get(key) is waiters:
+                    del self._waiters[key]
+            raise
+
+    def _add_in_flight(self, instance: OllamaInstance, delta: int):
+        with self._count_lock:
+            instance.in_flight += delta
+
+    def _release(self, instance: OllamaInstance, elapsed: Optional[float]):
+        self._add_in_flight(instance, -1)
+        if elapsed is not None:
+            instance.served += 1
+            self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * elapsed
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queued:
+            instance = self._pick()
+            if instance is None:
+                return
+            key, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if future.cancelled():
+                continue
+            self._add_in_flight(instance, 1)
+            future.set_result(instance)
+
+    @asynccontextmanager
+    async def _slot(self):
+        instance = await self._acquire()
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            yield instance
+            succeeded = True
+        finally:
+            self._release(instance, time.perf_counter() - started if succeeded else None)
+
+    def _mark_down(self, instance: OllamaInstance, error):
+        instance.failures += 1
+        instance.down_until = time.monotonic() + self.cooldown_seconds
+        print(f"Ollama at {instance.base_url} is unreachable, skipping it for {self.cooldown_seconds:.0f}s: {error}")
+
+    # --- HTTP ---
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to one event loop; scripts may run several
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            if self._client is not None:
+                self._close_stale_client(self._client, self._client_loop)
+            self._client = httpx.AsyncClient(timeout=self._timeout, limits=self._limits)
+            self._client_loop = loop
+        return self._client
+
+    @staticmethod
+    def _close_stale_client(client: httpx.AsyncClient, loop):
+        """Closes the client of an earlier event loop, on that loop if it still runs."""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+
+        async def close():
+            # Best effort: a closed loop may refuse to close its transports
+            with suppress(Exception):
+                await client.aclose()
+
+        asyncio.get_running_loop().create_task(close())
+
+    async def aclose(self):
+        """Closes the pooled connections (app shutdown)."""
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None:
+            await client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(timeout=self._timeout, limits=self._limits)
+        return self._sync_client
+
+    async def agenerate(self, payload: dict):
+        """Streams the JSON lines of an Ollama /api/generate call, waiting for a slot first."""
+        for attempt in range(len(self.instances)):
+            async with self._slot() as instance:
+                try:
+                    async with self.client.stream("POST", f"{instance.base_url}/api/generate", json=payload) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if line:
+                                yield json.loads(line)
+                    return
+                except _CONNECT_ERRORS as e:
+                    self._mark_down(instance, e)
+                    if attempt == len(self.instances) - 1:
+                        raise
+
+    def generate(self, payload: dict):
+        """Sync variant of agenerate; not queued."""
+        for attempt in range(len(self.instances)):
+            instance = self._pick() or min(self.instances, key=lambda i: i.in_flight)
+            self._add_in_flight(instance, 1)
+            try:
+                with self.sync_client.stream("POST", f"{instance.base_url}/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if line:
+                            yield json.loads(line)
+                instance.served += 1
+                return
+            except _CONNECT_ERRORS as e:
+                self._mark_down(instance, e)
+                if attempt == len(self.instances) - 1:
+                    raise
+            finally:
+                self._add_in_flight(instance, -1)
+                # Queued async requests may now fit; wake them on their loop
+                loop = self._waiter_loop
+                if self._queued and loop is not None and loop.is_running():
+                    loop.call_soon_threadsafe(self._dispatch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_generation_seconds": round(self._avg_seconds, 2),
+            "instances": [instance.to_dict() for instance in self.instances],
+        }
+
+
+def _chunk(part: dict) -> GenerationChunk:
+    # The last line carries Ollama's token counts and timings (and a large
+    # token "context" array we do not need)
+    info = {k: v for k, v in part.items() if k not in ("response", "context")} if part.get("done") else None
+    return GenerationChunk(text=part.get("response", ""), generation_info=info)
+
+
+class GatewayOllama(BaseLLM):
+    """Ollama completion model whose calls go through an LLMGateway."""
+
+    model: str
+    gateway: Any = None
+    # Passed through as Ollama "options" (temperature, num_ctx, ...)
+    options: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-gateway"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model, "options": self.options}
+
+    def _gateway(self) -> LLMGateway:
+        return self.gateway or gateway
+
+    def _payload(self, prompt, stop):
+        options = dict(self.options)
+        if stop:
+            options["stop"] = stop
+        return {"model": self.model, "prompt": prompt, "stream": True, "options": options}
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        for part in self._gateway().generate(self._payload(prompt, stop)):
+            chunk = _chunk(part)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        async for part in self._gateway().agenerate(self._payload(prompt, stop)):
+            chunk = _chunk(part)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs) -> LLMResult:
+        generations = []
+        for prompt in prompts:
+            final = None
+            for chunk in self._stream(prompt, stop, run_manager, **kwargs):
+                final = chunk if final is None else final + chunk
+            generations.append([final or GenerationChunk(text="")])
+        return LLMResult(generations=generations)
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs) -> LLMResult:
+        generations = []
+        for prompt in prompts:
+            final = None
+            async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+                final = chunk if final is None else final + chunk
+            generations.append([final or GenerationChunk(text="")])
+        return LLMResult(generations=generations)
+
+
+gateway = LLMGateway(
+    config.OLLAMA_BASE_URLS,
+    max_in_flight=config.LLM_MAX_IN_FLIGHT,
+    max_queue=config.LLM_MAX_QUEUE,
+    timeout=config.LLM_TIMEOUT_SECONDS,
+    connect_timeout=config.LLM_CONNECT_TIMEOUT_SECONDS,
+)
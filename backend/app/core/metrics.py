@@ -0,0 +1,180 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+# --- Prometheus histograms (served on /metrics) ---
+
+CHAT_STAGE_SECONDS = Histogram(
+    "rag_chat_stage_seconds",
+    "Time spent in each stage of a chat request.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "rag_llm_tokens_per_second",
+    "Generation speed of the answer LLM.",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200),
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds",
+    "Time spent in each stage of an ingestion job.",
+    ["kind", "stage"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+
+# Tag put on the LLM that writes the answer, so the timing handler can tell
+# it apart from the question-rewrite and SQL-generation calls.
+ANSWER_LLM_TAG = "answer_llm"
+
+_current = ContextVar("timings", default=None)
+
+
+class Timings:
+    """
+    Stage durations for one chat or ingest. A stage that runs several times
+    (e.g. embedding batches, PDF pages) accumulates.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.stages = {}
+        self.marks = {}
+        self.tokens = 0
+        self.tokens_per_second = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def mark(self, name: str):
+        self.marks[name] = time.perf_counter()
+
+    def stop(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    @property
+    def total(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_dict(self) -> dict:
+        result = {
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "total_ms": round(self.total * 1000, 1),
+        }
+        if self.tokens:
+            result["tokens"] = self.tokens
+            result["tokens_per_second"] = self.tokens_per_second
+        return result
+
+
+@contextmanager
+def tracking(timings: Timings):
+    """Makes `timings` the target of timed() calls in this context."""
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """Adds the duration of the block to the current Timings, if any."""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add(stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable, stage: str):
+    """Yields from `iterable`, counting the time spent producing items as `stage`."""
+    iterator = iter(iterable)
+    while True:
+        with timed(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def mark(name: str):
+    timings = _current.get()
+    if timings is not None:
+        timings.mark(name)
+
+
+def observe_chat(timings: Timings, cached: bool):
+    timings.stop()
+    for stage, seconds in timings.stages.items():
+        CHAT_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    CHAT_STAGE_SECONDS.labels(stage="total_cached" if cached else "total").observe(timings.total)
+    if timings.tokens_per_second:
+        LLM_TOKENS_PER_SECOND.observe(timings.tokens_per_second)
+
+
+def observe_ingest(kind: str, timings: Timings):
+    timings.stop()
+    for stage, seconds in timings.stages.items():
+        INGEST_STAGE_SECONDS.labels(kind=kind, stage=stage).observe(seconds)
+    INGEST_STAGE_SECONDS.labels(kind=kind, stage="total").observe(timings.total)
+
+
+def render():
+    """Current metrics in the Prometheus text format: (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class LLMTimingHandler(BaseCallbackHandler):
+    """
+    Records prompt assembly (end of retrieval to LLM start), time to first
+    token, total generation time and tokens/sec of the answer LLM.
+    """
+    # Called on the event loop directly instead of via a thread per token
+    run_inline = True
+
+    def __init__(self, timings: Timings):
+        self.timings = timings
+        self._run_id = None
+        self._started = None
+        self._first_token = None
+        self._chunks = 0
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        if ANSWER_LLM_TAG not in (tags or []):
+            return
+        self._run_id = run_id
+        self._started = time.perf_counter()
+        if "retrieved" in self.timings.marks:
+            self.timings.add("prompt", self._started - self.timings.marks["retrieved"])
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if run_id != self._run_id:
+            return
+        self._chunks += 1
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+            self.timings.add("llm_first_token", self._first_token - self._started)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id != self._run_id:
+            return
+        elapsed = time.perf_counter() - self._started
+        self.timings.add("llm_total", elapsed)
+        # Ollama reports its own token count and decode time on the last chunk
+        info = {}
+        if response.generations and response.generations[0]:
+            info = response.generations[0][0].generation_info or {}
+        if info.get("eval_count") and info.get("eval_duration"):
+            self.timings.tokens = info["eval_count"]
+            self.timings.tokens_per_second = round(info["eval_count"] / (info["eval_duration"] / 1e9), 2)
+        elif self._chunks:
+            self.timings.tokens = self._chunks
+            self.timings.tokens_per_second = round(self._chunks / elapsed, 2) if elapsed > 0 else None
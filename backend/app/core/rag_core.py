@@ -1,30 +1,43 @@
+import asyncio
+import json
 import os
-import shutil
-import chromadb # NEW IMPORT
+import re
+import threading
+import urllib.request
+from contextlib import nullcontext
 
-from langchain_community.llms import Ollama
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader,WebBaseLoader # <-- Add WebBaseLoader
 
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+from operator import itemgetter
 # from app.core.prompts import rag_prompt
 
 import csv # <-- ADD THIS
 from langchain_core.documents import Document
 
+from app.core import config
+from app.core.embedding import EmbeddingEngine, LazyEmbeddings
+from app.core.embedding_cache import EmbeddingCache
+from app.core.answer_cache import AnswerCache, CachedAnswer
+from app.core.context_builder import build_context, compact_history
+from app.core.crawler import Crawler
+from app.core.knowledge_base import KnowledgeBase, KnowledgeBaseRegistry
+from app.core.llm_gateway import GatewayOllama, gateway
+from app.core.metrics import ANSWER_LLM_TAG, mark, timed, timed_iter
+from app.core.reranker import CrossEncoderReranker
+from app.core.embedding_cache import content_hash
+from app.core.source_registry import file_hash
+from app.core.filters import build_where, structured_tables
+
 # --- Initialize Core Components ---
 # vector_db_path = "local_chroma_db"
 # client = chromadb.PersistentClient(path=vector_db_path)
 client = None
-vectorstore = None
-conversational_chain = None
 # embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vector_db_path = "local_chroma_db"
+vector_db_path = config.KNOWLEDGE_BASE_DIR
 
 rag_prompt = '''
 """
@@ -67,127 +80,309 @@ Read the retrieved context carefully and use them to construct your answer.
 """
 
 '''
-print("Initializing local embedding model...")
-embeddings = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",
-    model_kwargs={'device': 'cpu'}
+def _load_embedding_model():
+    # Heavy import (torch, sentence-transformers); only done when first needed
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    print("Initializing local embedding model...")
+    model = HuggingFaceEmbeddings(
+        model_name=config.EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'}
+    )
+    print("✅ Embedding model loaded.")
+    return model
+
+
+# The model is loaded on first use or by warm_up(), not at import time
+embeddings = LazyEmbeddings(_load_embedding_model)
+embedding_cache = (
+    EmbeddingCache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_MODEL_NAME)
+    if config.EMBEDDING_CACHE_PATH else None
+)
+embedding_engine = EmbeddingEngine(
+    embeddings,
+    batch_size=config.EMBED_BATCH_SIZE,
+    workers=config.EMBED_WORKERS,
+    cache=embedding_cache,
 )
-print("✅ Embedding model loaded.")
 
 # llm = Ollama(model="gemma:2b")
 # llm = Ollama(model="tinyllama")
-llm = Ollama(model="gemma:2b-instruct-q4_0") # Use the quantized model
-
-
-
-print("✅ LLM model loaded.")
-
-# IMPORTANT: Initialize global variables to None.
-# This prevents a file lock on application startup.
-vectorstore = None
-conversational_chain = None
-
-def ingest_website(url: str):
+# Constructing the client is cheap; nothing talks to Ollama until a request.
+# Calls go through the LLM gateway (pooled connections, queue, several instances)
+llm = GatewayOllama(model=config.LLM_MODEL) # Use the quantized model
+# Optional cheaper model for question rewriting; None means use `llm`
+rewrite_llm = GatewayOllama(model=config.REWRITE_MODEL) if config.REWRITE_MODEL else None
+
+# Optional cross-encoder applied to the retrieved candidates
+reranker = CrossEncoderReranker(
+    config.RERANK_MODEL,
+    top_n=config.RERANK_TOP_N,
+    batch_size=config.RERANK_BATCH_SIZE,
+    cache_size=config.RERANK_CACHE_SIZE,
+) if config.RERANK_MODEL else None
+
+# The default knowledge base, used when a request does not name one
+COLLECTION_NAME = "langchain"
+
+
+def _report(progress, stage, **counts):
+    if progress:
+        progress(stage, **counts)
+
+
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the Chroma client, opening it on first use."""
+    with _client_lock:
+        if client is None:
+            initialize_database()
+    return client
+
+
+def _llm_available() -> bool:
+    """True when at least one Ollama instance answers and has the chat model pulled."""
+    for instance in gateway.instances:
+        try:
+            with urllib.request.urlopen(f"{instance.base_url}/api/tags", timeout=2) as response:
+                models = json.load(response).get("models", [])
+        except Exception:
+            continue
+        names = {m.get("name") for m in models} | {m.get("model") for m in models}
+        if config.LLM_MODEL in names:
+            return True
+    return False
+
+
+def readiness() -> dict:
+    """Which components are loaded; the app is ready when all are."""
+    return {
+        "embedding_model": embeddings.loaded,
+        "knowledge_base": knowledge_bases.get().loaded,
+        "llm": _llm_available(),
+    }
+
+
+def warm_up():
+    """Loads the embedding model and opens the knowledge base ahead of traffic."""
+    try:
+        embeddings.embed_query("warm up")
+        if reranker is not None:
+            reranker.model
+        knowledge_bases.get().current()
+        print("✅ Warm-up complete.")
+    except Exception as e:
+        print(f"Warm-up failed, components will load on first use: {e}")
+
+
+def ingest_website(urls, sitemap: str = None, kb_name: str = None, progress=None):
     """
-    Loads data from a website URL, splits it into chunks, and ADDS it to the
-    persistent vector store.
+    Crawls one URL, a list of URLs and/or a sitemap concurrently and ADDS the
+    pages to the knowledge base `kb_name` (default one if None). Pages are
+    split and embedded as they arrive; pages unchanged since the last crawl
+    (ETag/Last-Modified, else same text) are not downloaded or split again,
+    and a changed page only has its changed chunks embedded.
     """
-    global vectorstore, conversational_chain
-
-    print(f"Loading content from website: {url}")
-    loader = WebBaseLoader(url)
-    documents = loader.load()
-    
-    # Add the source metadata to each document chunk
-    for doc in documents:
-        doc.metadata["source"] = url
-
+    if isinstance(urls, str):
+        urls = [urls]
+    print(f"Crawling {len(urls)} URL(s){' and sitemap ' + sitemap if sitemap else ''}...")
+    _report(progress, "crawling")
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    texts = text_splitter.split_documents(documents)
-    
-    print(f"Adding {len(texts)} new document chunks from the website to ChromaDB...")
-
-    # Same logic as ingest_documents to add to the existing store
-    if vectorstore:
-        vectorstore.add_documents(documents=texts)
-    else:
-        # This will likely not be hit if a PDF is uploaded first, but it's good practice
-        vectorstore = Chroma.from_documents(
-            documents=texts, 
-            embedding=embeddings,
-            client=client,
-            collection_name="langchain"
-        )
-    
-    print("✅ Website content added successfully!")
-
-    # Update the conversational_chain to use the retriever with the new data
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    conversational_chain = get_conversational_rag_chain(retriever)
-    print("✅ Conversational chain has been updated with the new retriever.")
 
-def ingest_documents(file_path: str):
+    knowledge_base = knowledge_bases.get(kb_name)
+    with knowledge_base.snapshot() as state:
+        crawler = Crawler(cache=state.crawl_cache)
+        page_hashes = {}
+
+        def chunks():
+            produced = 0
+            for page in timed_iter(crawler.pages(urls, sitemap), "load"):
+                digest = content_hash(page.page_content)
+                if state.source_registry.content_hash(page.metadata["source"]) == digest:
+                    # Servers without ETag/Last-Modified resend identical pages
+                    crawler.unchanged += 1
+                    continue
+                page_hashes[page.metadata["source"]] = digest
+                with timed("split"):
+                    page_chunks = text_splitter.split_documents([page])
+                for chunk in page_chunks:
+                    produced += 1
+                    yield chunk
+                _report(progress, "embedding", chunks_total=produced)
+
+        knowledge_base.sync_sources(state, "website", chunks(), page_hashes, progress)
+        crawler.commit()
+    print(f"✅ Website content added successfully! {crawler.fetched} pages fetched, "
+          f"{crawler.unchanged} unchanged, {crawler.failed} failed.")
+
+
+def _pdf_chunks(file_path: str, progress=None):
     """
-    Loads a PDF, splits it into chunks, and ADDS it to the
-    persistent vector store without deleting previous content.
+    Parses the PDF one page at a time and yields that page's chunks, so only
+    the current page and the batch being embedded are ever held in memory.
     """
-    global vectorstore, conversational_chain
+    from langchain_community.document_loaders import PyPDFLoader
 
+    source = os.path.basename(file_path)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    produced = 0
+    for page in timed_iter(PyPDFLoader(file_path).lazy_load(), "load"):
+        page.metadata["source"] = source
+        with timed("split"):
+            page_chunks = text_splitter.split_documents([page])
+        for chunk in page_chunks:
+            produced += 1
+            yield chunk
+        # The total is only known once the last page is parsed
+        _report(progress, "embedding", chunks_total=produced)
+
+
+def ingest_documents(file_path: str, kb_name: str = None, progress=None):
+    """
+    Streams a PDF page by page into the knowledge base `kb_name` without
+    deleting previous content. Chunks are embedded and committed in
+    EMBED_BATCH_SIZE windows, so peak memory does not grow with the document
+    and early pages are searchable before the last page is parsed.
+    """
     # --- NO DELETION LOGIC HERE ---
-    # We will only add to the existing database.
-
-    # 1. Load and process the new document
+    # Other sources are never touched; a new version of the same file only
+    # replaces the chunks that changed.
     print(f"Loading document: {file_path}")
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    
-    for doc in documents:
-        doc.metadata["source"] = os.path.basename(file_path)
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    texts = text_splitter.split_documents(documents)
-    
-    print(f"Adding {len(texts)} new document chunks to ChromaDB...")
-
-    # 2. Check if the vectorstore object exists in memory
-    if vectorstore:
-        # If it exists, just add the new documents
-        vectorstore.add_documents(documents=texts)
-    else:
-        # If it's the first run, create the vectorstore from scratch
-        vectorstore = Chroma.from_documents(
-            documents=texts, 
-            embedding=embeddings,
-            client=client,
-            collection_name="langchain"
-        )
-    
+    source = os.path.basename(file_path)
+    digest = file_hash(file_path)
+    knowledge_base = knowledge_bases.get(kb_name)
+    with knowledge_base.snapshot() as state:
+        if state.source_registry.content_hash(source) == digest:
+            _report(progress, "unchanged")
+            print(f"✅ '{source}' is unchanged, nothing to do.")
+            return
+        _report(progress, "embedding")
+        knowledge_base.sync_sources(state, "pdf", _pdf_chunks(file_path, progress), {source: digest}, progress)
     print("✅ Documents added successfully!")
 
-    # 3. Update the conversational_chain to use the retriever with the new data
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    conversational_chain = get_conversational_rag_chain(retriever)
-    print("✅ Conversational chain has been updated with the new retriever.")
-    print(f"--- CHECKPOINT 1 [AFTER INGEST] --- Type of conversational_chain is: {type(conversational_chain)}")
 
+def set_llm(new_llm):
+    """
+    Swaps the LLM used by the chain (e.g. a FakeStreamingListLLM stand-in for
+    testing the streaming endpoint) and rebuilds the chains of the loaded
+    knowledge bases; the others pick it up when they are next opened.
+    """
+    global llm, standalone_question_chain
+    llm = new_llm
+    standalone_question_chain = get_standalone_question_chain()
+    for knowledge_base in knowledge_bases.loaded():
+        knowledge_base.rebuild_chain()
+
+
+def _with_compact_history(inputs):
+    if not config.CONTEXT_COMPRESSION:
+        return inputs
+    return {**inputs, "chat_history": compact_history(inputs["chat_history"])}
 
 
-def get_conversational_rag_chain(retriever):
+def get_standalone_question_chain():
+    """
+    Produces the question used for retrieval (and as the answer-cache key):
+    the precomputed one if the caller already has it, the raw query when
+    there is no history (no LLM call at all), otherwise a rewrite with a
+    short dedicated prompt on the rewrite model.
+    """
     contextualize_q_system_prompt = """Given a chat history and the latest user question \
     which might reference context in the chat history, formulate a standalone question \
     which can be understood without the chat history. Do NOT answer the question, \
-    just reformulate it if needed and otherwise return it as is."""
+    just reformulate it if needed and otherwise return it as is. \
+    Reply with the question only."""
     contextualize_q_prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", rag_prompt),
+            ("system", contextualize_q_system_prompt),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ]
     )
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
+    # The rewrite is a single line; stopping there keeps the call short
+    rewriter = (rewrite_llm or llm).bind(stop=["\n\n"])
+    return RunnableBranch(
+        (lambda x: bool(x.get("standalone_question")), itemgetter("standalone_question")),
+        (lambda x: not x.get("chat_history"), itemgetter("input")),
+        RunnableLambda(_with_compact_history) | contextualize_q_prompt | rewriter | StrOutputParser()
+        | RunnableLambda(str.strip),
     )
 
+
+standalone_question_chain = get_standalone_question_chain()
+
+
+def get_sql_chain(structured_store):
+    """
+    Turns {"question", "tables"} into one SQLite SELECT over those uploaded
+    CSV tables.
+    """
+    sql_prompt = PromptTemplate.from_template(
+        """You are a SQLite expert. Write ONE SQLite SELECT query that answers the question \
+using only the tables and columns below. Reply with the SQL only, no explanation.
+
+{schema}
+
+Question: {question}
+SQL:"""
+    )
+    return (
+        RunnableLambda(lambda inputs: {
+            "schema": structured_store.schema_description(inputs["tables"]),
+            "question": inputs["question"],
+        })
+        | sql_prompt
+        | llm.bind(stop=["\n\n"])
+        | StrOutputParser()
+    )
+
+
+def _extract_sql(text: str) -> str:
+    text = text.strip()
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    return text.strip().split(";")[0]
+
+
+async def _agenerate_sql(sql_chain, question, tables):
+    try:
+        with timed("sql_generation"):
+            return await sql_chain.ainvoke({"question": question, "tables": tables})
+    except Exception as e:
+        print(f"SQL generation failed: {e}")
+        return ""
+
+
+def _structured_context(structured_store, question, generate_sql, tables):
+    """
+    Answers a filter/aggregate question straight from the CSV tables the
+    filters allow. Returns a one-document context with the query result, or
+    [] so the caller falls back to vector search.
+    """
+    try:
+        sql = _extract_sql(generate_sql({"question": question, "tables": tables}))
+        if not sql:
+            return []
+        with timed("sql_query"):
+            columns, rows = structured_store.query(sql, max_rows=config.STRUCTURED_MAX_ROWS, tables=tables)
+    except Exception as e:
+        print(f"Structured query failed, falling back to vector search: {e}")
+        return []
+    if not rows:
+        return []
+    sources = [t["source"] for t in structured_store.tables()
+               if t["name"] in tables and re.search(rf'\b{t["name"]}\b', sql)]
+    table = "\n".join([" | ".join(columns)] + [" | ".join(str(value) for value in row) for row in rows])
+    return [Document(
+        page_content=f"Result of the query `{sql}`:\n{table}",
+        metadata={"source": ", ".join(sources) or "structured data", "sql": sql, "rows": len(rows)},
+    )]
+
+
+def get_conversational_rag_chain(retriever, structured_store):
     # qa_system_prompt = """You are an assistant for question-answering tasks. \
     # Use the following pieces of retrieved context to answer the question. \
     # If you don't know the answer, just say that you don't know. \
@@ -203,56 +398,247 @@ def get_conversational_rag_chain(retriever):
         ]
     )
 
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # Tagged so the per-request timing handler can find the answer generation
+    question_answer_chain = create_stuff_documents_chain(llm.with_config(tags=[ANSWER_LLM_TAG]), qa_prompt)
+    sql_chain = get_sql_chain(structured_store)
+
+    def _structured(inputs):
+        # Tables the SQL path may read for this question, [] to skip it
+        tables = structured_tables(inputs.get("filters"), structured_store)
+        if tables and structured_store.looks_structured(inputs["standalone_question"], tables):
+            return tables
+        return []
+
+    def _retrieve(inputs):
+        tables = _structured(inputs)
+        if tables:
+            documents = _structured_context(structured_store, inputs["standalone_question"], sql_chain.invoke, tables)
+            if documents:
+                return documents
+        return retriever.invoke(inputs["standalone_question"], filter=build_where(inputs.get("filters")))
+
+    async def _aretrieve(inputs):
+        # The catalog lookups and the query itself are blocking SQLite calls
+        tables = await asyncio.to_thread(_structured, inputs)
+        if tables:
+            sql = await _agenerate_sql(sql_chain, inputs["standalone_question"], tables)
+            documents = await asyncio.to_thread(
+                _structured_context, structured_store, inputs["standalone_question"], lambda _: sql, tables,
+            )
+            if documents:
+                _cancel_speculative(inputs)
+                return documents
+        speculative = inputs.get("speculative_context")
+        if speculative:
+            query, task = speculative
+            if _same_question(query, inputs["standalone_question"]):
+                return await task
+            task.cancel()
+        return await retriever.ainvoke(inputs["standalone_question"], filter=build_where(inputs.get("filters")))
+
+    def _rerank(inputs, documents):
+        # SQL results are already exact; only retrieved chunks are reranked
+        if reranker is None or any("sql" in doc.metadata for doc in documents):
+            return documents
+        return reranker.rerank(inputs["standalone_question"], documents)
+
+    def retrieve(inputs):
+        with timed("retrieval"):
+            documents = _rerank(inputs, _retrieve(inputs))
+        mark("retrieved")
+        return documents
+
+    async def aretrieve(inputs):
+        with timed("retrieval"):
+            documents = await _aretrieve(inputs)
+            # The cross-encoder is CPU-bound; keep it off the event loop
+            documents = await asyncio.to_thread(_rerank, inputs, documents)
+        mark("retrieved")
+        return documents
+
+    def build_prompt_inputs(inputs):
+        # Only the prompt gets the compressed context; "context" in the
+        # result keeps the retrieved chunks for the sources panel
+        if not config.CONTEXT_COMPRESSION:
+            return inputs
+        with timed("context_build"):
+            return {
+                **_with_compact_history(inputs),
+                "context": build_context(inputs["context"], inputs["standalone_question"]),
+            }
+
+    # Same output keys as create_retrieval_chain, plus the standalone question
+    rag_chain = (
+        RunnablePassthrough.assign(standalone_question=get_standalone_question_chain())
+        .assign(context=RunnableLambda(retrieve, afunc=aretrieve))
+        .assign(answer=RunnableLambda(build_prompt_inputs) | question_answer_chain)
+    )
     
     return rag_chain
 
 
-def ingest_structured_data(file_path: str):
+def _same_question(a: str, b: str) -> bool:
+    return " ".join(a.lower().split()).strip(" ?") == " ".join(b.lower().split()).strip(" ?")
+
+
+async def aresolve_standalone_question(payload, state):
     """
-    Dynamically loads data from any CSV file, formats each row into a sentence,
-    and ADDS it to the persistent vector store.
+    Stores the standalone question in the payload. For follow-ups, retrieval
+    on the raw query is started speculatively while the rewrite runs; the
+    chain reuses it when the rewrite returns the question unchanged.
     """
-    global vectorstore, conversational_chain
-    
-    print(f"Loading structured data from: {file_path}")
-    documents = []
-    with open(file_path, mode='r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Dynamically create a sentence from all columns in the row
-            content = ". ".join([f"{key}: {value}" for key, value in row.items()])
-            
-            # Create a metadata dictionary from the row's data
-            metadata = row.copy()
-            metadata["source"] = os.path.basename(file_path)
-
-            doc = Document(page_content=content, metadata=metadata)
-            documents.append(doc)
-
-    print(f"Adding {len(documents)} new records from CSV to ChromaDB...")
-    
-    if vectorstore:
-        vectorstore.add_documents(documents=documents)
-    else:
-        vectorstore = Chroma.from_documents(
-            documents=documents, 
-            embedding=embeddings,
-            client=client,
-            collection_name="langchain"
+    if payload.get("chat_history") and config.SPECULATIVE_RETRIEVAL:
+        task = asyncio.ensure_future(
+            state.retriever.ainvoke(payload["input"], filter=build_where(payload.get("filters")))
         )
-    
+        payload["speculative_context"] = (payload["input"], task)
+    # Without history there is no rewrite call, so nothing to time
+    try:
+        with timed("rewrite") if payload.get("chat_history") else nullcontext():
+            payload["standalone_question"] = await standalone_question_chain.ainvoke(payload)
+    except BaseException:
+        # e.g. GatewayBusy or a cancelled chat: nothing will await the retrieval
+        _cancel_speculative(payload)
+        raise
+    return payload["standalone_question"]
+
+
+def _cancel_speculative(payload):
+    if payload.get("speculative_context"):
+        payload["speculative_context"][1].cancel()
+
+
+async def alookup_answer(payload, state):
+    """
+    Resolves the standalone question for a chat payload and looks it up in
+    the answer cache. Returns (cached answer or None, question embedding,
+    cache epoch) to hand back to cache_answer; the standalone question is
+    stored back into the payload so the chain does not reformulate it a
+    second time.
+    """
+    # Taken before any retrieval starts, so an ingest or reset that lands
+    # while this chat runs keeps its answer out of the cache
+    epoch = state.answer_cache.epoch
+    await aresolve_standalone_question(payload, state)
+    # Cached answers were built from unfiltered context
+    if not state.answer_cache.enabled or build_where(payload.get("filters")):
+        return None, None, epoch
+    try:
+        with timed("embedding"):
+            vector = await embeddings.aembed_query(payload["standalone_question"])
+    except BaseException:
+        _cancel_speculative(payload)
+        raise
+    cached = state.answer_cache.lookup(vector)
+    if cached:
+        _cancel_speculative(payload)
+    return cached, vector, epoch
+
+
+def cache_answer(vector, epoch, result, generation_seconds: float, state):
+    if vector is None:
+        return
+    state.answer_cache.store(vector, CachedAnswer(
+        question=result["standalone_question"],
+        answer=result["answer"],
+        context=result["context"],
+        generation_seconds=generation_seconds,
+    ), epoch=epoch)
+
+
+def _new_knowledge_base(name):
+    # Each tenant gets its own answer cache so answers never leak across tenants
+    return KnowledgeBase(
+        name,
+        client_factory=get_client,
+        embeddings=embeddings,
+        embedding_engine=embedding_engine,
+        build_chain=get_conversational_rag_chain,
+        answer_cache=AnswerCache(
+            max_entries=config.ANSWER_CACHE_SIZE,
+            ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+            threshold=config.ANSWER_CACHE_THRESHOLD,
+        ),
+    )
+
+
+knowledge_bases = KnowledgeBaseRegistry(
+    _new_knowledge_base,
+    client_factory=get_client,
+    default_name=COLLECTION_NAME,
+    max_loaded=config.KB_MAX_LOADED,
+    idle_seconds=config.KB_IDLE_SECONDS,
+)
+
+
+def ingest_structured_data(file_path: str, kb_name: str = None, progress=None):
+    """
+    Loads any CSV into a typed, indexed SQLite table (answered with SQL for
+    filter/aggregate questions), and ADDS a document per row built from its
+    free-text columns to the knowledge base `kb_name`. Re-uploading a CSV
+    replaces its table and only embeds the rows that changed.
+    """
+    print(f"Loading structured data from: {file_path}")
+    _report(progress, "loading")
+    source = os.path.basename(file_path)
+    digest = file_hash(file_path)
+    knowledge_base = knowledge_bases.get(kb_name)
+    with knowledge_base.snapshot() as state:
+        if state.source_registry.content_hash(source) == digest:
+            _report(progress, "unchanged")
+            print(f"✅ '{source}' is unchanged, nothing to do.")
+            return
+        with timed("load"):
+            table = state.structured_store.ingest_csv(file_path, source)
+        print(f"Loaded {table['rows']} rows into table '{table['name']}'.")
+        with timed("split"):
+            documents = _csv_row_documents(file_path, source, table)
+        print(f"Adding {len(documents)} records from CSV to ChromaDB...")
+        knowledge_base.sync_sources(state, "csv", documents, {source: digest}, progress)
     print("✅ Structured data added successfully!")
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    conversational_chain = get_conversational_rag_chain(retriever)
-    print("✅ Conversational chain has been updated.")
+
+# Columns that name or identify a row (product_id, sku, product_name, ...)
+_KEY_COLUMN_RE = re.compile(r"(^|_)(id|sku|code|no|number|name|title)$")
+
+
+def _csv_row_documents(file_path, source, table):
+
+    # Other numbers are answered by SQL; ids and names are embedded with the
+    # descriptive text so an exact SKU or product name still finds its row.
+    # Tables without long free-text columns fall back to all text columns so
+    # their rows stay findable by vector search.
+    text_columns = [c["original"] for c in table["columns"] if c["free_text"]]
+    if not text_columns:
+        text_columns = [c["original"] for c in table["columns"] if c["type"] == "TEXT"]
+    key_columns = [c["original"] for c in table["columns"] if _KEY_COLUMN_RE.search(c["name"])]
+    embedded = [key for key in key_columns if key not in text_columns] + text_columns
+
+    documents = []
+    if text_columns:
+        with open(file_path, mode='r', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            for row in reader:
+                content = ". ".join([f"{key}: {row.get(key)}" for key in embedded])
+                
+                # Create a metadata dictionary from the row's data
+                metadata = {key: value for key, value in row.items() if key is not None}
+                metadata["source"] = source
+                metadata["table"] = table["name"]
+
+                # Keyed on the whole row: rows that read alike stay separate
+                # chunks with their own metadata
+                values = [str(row.get(c["original"]) or "") for c in table["columns"]]
+                doc = Document(page_content=content, metadata=metadata, id=content_hash(source, *values))
+                documents.append(doc)
+    return documents
 
 
 def initialize_database():
     """Initializes the ChromaDB client."""
     global client
+    import chromadb
+
     print("Initializing ChromaDB client...")
     client = chromadb.PersistentClient(path=vector_db_path)
     print("✅ ChromaDB client initialized.")
@@ -282,25 +668,27 @@ def initialize_database():
 # initialize_database()
 
 
-def reset_database():
+def reset_database(kb_name: str = None):
     """
-    Resets the ChromaDB database using the client's reset method and
-    clears the in-memory state.
+    Resets one knowledge base (the default one if None); other tenants are
+    untouched. A fresh, empty collection is swapped in atomically and the
+    old one is deleted once no chat is still using it.
     """
-    global vectorstore, conversational_chain, client
-    
-    print("Resetting ChromaDB...")
-    
-    # Use the official ChromaDB client method to reset the database.
-    # This is safer than manually deleting files.
-    if client:
-        client.reset()
-    
-    # Reset the in-memory LangChain objects
-    vectorstore = None
-    conversational_chain = None
-    
-    # Re-initialize the client to be ready for the next upload
-    initialize_database()
-    
-    print("✅ Database reset successfully.")
\ No newline at end of file
+    knowledge_base = knowledge_bases.get(kb_name)
+    print(f"Resetting knowledge base '{knowledge_base.name}'...")
+    knowledge_base.reset()
+    print("✅ Database reset successfully.")
+
+
+def list_sources(kb_name: str = None):
+    """Sources in the knowledge base with their content hash and chunk count."""
+    return knowledge_bases.get(kb_name).current().source_registry.list()
+
+
+def get_source(source: str, kb_name: str = None):
+    return knowledge_bases.get(kb_name).current().source_registry.get(source)
+
+
+def delete_source(source: str, kb_name: str = None) -> bool:
+    """Removes one file or URL from the knowledge base; the other sources are untouched."""
+    return knowledge_bases.get(kb_name).delete_source(source)
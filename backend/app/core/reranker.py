@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from app.core.embedding_cache import content_hash
+from app.core.metrics import timed
+
+
+class CrossEncoderReranker:
+    """
+    Reorders retrieved chunks by a cross-encoder's relevance score for the
+    question and keeps the best `top_n`. All uncached (question, chunk)
+    pairs of a call are scored in one batched predict; scores are kept in
+    an LRU cache so repeated questions over the same chunks cost nothing.
+    The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str, top_n: int = 3, batch_size: int = 32, cache_size: int = 10000):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._scores = OrderedDict()    # content_hash(question, chunk) -> score
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.total_seconds = 0.0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    print(f"Loading reranker '{self.model_name}'...")
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    print("✅ Reranker loaded.")
+        return self._model
+
+    def _cached(self, keys):
+        with self._lock:
+            scores = {}
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[key] = self._scores[key]
+            return scores
+
+    def _store(self, scores):
+        with self._lock:
+            self._scores.update(scores)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def score(self, query: str, documents):
+        """Relevance score of each document for the query, in input order."""
+        keys = [content_hash(query, doc.page_content) for doc in documents]
+        scores = self._cached(keys)
+        missing = [(key, doc) for key, doc in zip(keys, documents) if key not in scores]
+        if missing:
+            predicted = self.model.predict(
+                [(query, doc.page_content) for _, doc in missing], batch_size=self.batch_size,
+            )
+            fresh = {key: float(value) for (key, _), value in zip(missing, predicted)}
+            self._store(fresh)
+            scores.update(fresh)
+        self.pairs_scored += len(missing)
+        self.cache_hits += len(documents) - len(missing)
+        return [scores[key] for key in keys]
+
+    def rerank(self, query: str, documents, top_n: int = None):
+        """The `top_n` most relevant documents, best first, with their score in the metadata."""
+        if not documents:
+            return documents
+        started = time.perf_counter()
+        with timed("rerank"):
+            scores = self.score(query, documents)
+        self.calls += 1
+        self.total_seconds += time.perf_counter() - started
+        # Ties keep the retriever's order
+        ranked = sorted(zip(scores, range(len(documents))), key=lambda pair: (-pair[0], pair[1]))
+        ranked = ranked[:top_n or self.top_n]
+        return [
+            Document(
+                page_content=documents[i].page_content,
+                metadata={**documents[i].metadata, "rerank_score": round(score, 4)},
+                id=documents[i].id,
+            )
+            for score, i in ranked
+        ]
+
+    def stats(self) -> dict:
+        pairs = self.pairs_scored + self.cache_hits
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "cache_hit_rate": round(self.cache_hits / pairs, 3) if pairs else None,
+            "avg_rerank_ms": round(self.total_seconds / self.calls * 1000, 1) if self.calls else None,
+        }
@@ -0,0 +1,90 @@
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from app.core.metrics import timed
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Fuses several ranked lists of ids: each id scores sum(1 / (k + rank)).
+    Returns ids ordered best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense Chroma search plus BM25 over the lexical index, merged with
+    reciprocal rank fusion. Hits are keyed by the ids Chroma stored, which
+    are also the lexical index's ids; lexical-only hits are fetched from the
+    collection by id.
+
+    Without a lexical index this is plain dense search that still records
+    the embedding and vector_search stages.
+
+    A metadata `filter` (Chroma where clause) restricts Chroma's HNSW search
+    to matching chunks. BM25 ranks the whole corpus and its top
+    `oversample` x fetch_k hits are then checked against the filter by id,
+    so a filtered query costs no more than an unfiltered one.
+    """
+    vectorstore: Any
+    collection: Any
+    lexical_index: Any = None
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+    oversample: int = 4
+
+    def _dense_search(self, query_vector, filter=None):
+        """{id: Document} for the nearest chunks, best first."""
+        found = self.collection.query(
+            query_embeddings=[query_vector], n_results=self.fetch_k, where=filter,
+            include=["documents", "metadatas"],
+        )
+        return self._documents(found["ids"][0], found["documents"][0], found["metadatas"][0])
+
+    @staticmethod
+    def _documents(ids, texts, metadatas):
+        return {doc_id: Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(ids, texts, metadatas)}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None, filter=None) -> List[Document]:
+        with timed("embedding"):
+            query_vector = self.vectorstore.embeddings.embed_query(query)
+        with timed("vector_search"):
+            by_id = self._dense_search(query_vector, filter)
+        dense_ids = list(by_id)
+        lexical_ids = []
+        if self.lexical_index is not None:
+            with timed("lexical_search"):
+                hits = self.lexical_index.search(query, k=self.fetch_k * self.oversample if filter else self.fetch_k)
+                lexical_ids = [doc_id for doc_id, _ in hits]
+            if filter and lexical_ids:
+                by_id.update(self._fetch(lexical_ids, filter))
+                lexical_ids = [doc_id for doc_id in lexical_ids if doc_id in by_id][:self.fetch_k]
+
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ids], k=self.rrf_k)[:self.k]
+
+        missing = [doc_id for doc_id in fused if doc_id not in by_id]
+        if missing:
+            by_id.update(self._fetch(missing))
+        return [by_id[doc_id] for doc_id in fused if doc_id in by_id]
+
+    def _fetch(self, ids, filter=None):
+        """Documents for these ids from Chroma, keeping only those matching `filter`."""
+        with timed("vector_search"):
+            found = self.collection.get(ids=ids, where=filter, include=["documents", "metadatas"])
+        return self._documents(found["ids"], found["documents"], found["metadatas"])
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None, filter=None) -> List[Document]:
+        # The default implementation does not forward extra arguments such as `filter`
+        return await run_in_executor(
+            None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), filter=filter,
+        )
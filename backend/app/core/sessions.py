@@ -0,0 +1,198 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.core import config
+
+_FIRST_SENTENCE_RE = re.compile(r"^(.+?[.!?])(\s|$)", re.DOTALL)
+
+
+@dataclass
+class ChatSession:
+    """
+    One conversation with one knowledge base: the last `window` turns
+    verbatim plus a rolling summary of everything older, so its size does
+    not grow with length.
+    """
+    id: str
+    knowledge_base: str
+    window: int
+    turns: deque = None
+    summary: str = ""
+    updated_at: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        self.turns = deque(self.turns or [], maxlen=self.window)
+
+    def messages(self):
+        """History for the chain: summary (if any) then the windowed turns."""
+        messages = [SystemMessage(content=self.summary)] if self.summary else []
+        for human, ai in self.turns:
+            messages.append(HumanMessage(content=human))
+            messages.append(AIMessage(content=ai))
+        return messages
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.id,
+            "knowledge_base": self.knowledge_base,
+            "summary": self.summary,
+            "turns": [list(turn) for turn in self.turns],
+            "updated_at": self.updated_at,
+        }
+
+
+def _summarize_turn(human: str, ai: str) -> str:
+    match = _FIRST_SENTENCE_RE.match(ai.strip())
+    answer = match.group(1) if match else ai.strip()
+    return f"Q: {human.strip()[:150]} A: {answer[:200]}"
+
+
+class SessionStore:
+    """
+    Server-side chat histories, kept in memory (LRU, bounded, idle sessions
+    expire) and optionally mirrored to SQLite so they survive a restart.
+    Sessions are keyed by (knowledge base, id) and ids are only minted here,
+    so a session never carries history across tenants. Methods that touch
+    SQLite block; call them through run_blocking.
+
+    Each session keeps only its last `window` turns; a turn pushed out of the
+    window is folded into a rolling summary capped at `summary_chars`. That
+    fold is extractive (question plus first sentence of the answer), so
+    keeping history costs no LLM call and the per-turn cost is constant.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 86400, window: int = 6,
+                 summary_chars: int = 1000, path: str = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.window = max(1, window)
+        self.summary_chars = summary_chars
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (knowledge_base TEXT NOT NULL, id TEXT NOT NULL, "
+                "summary TEXT NOT NULL, turns TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (knowledge_base, id))"
+            )
+            self._conn.commit()
+
+    def create(self, knowledge_base: str) -> ChatSession:
+        with self._lock:
+            session = self._put(ChatSession(id=uuid.uuid4().hex, knowledge_base=knowledge_base, window=self.window))
+            self._save(session)
+            return session
+
+    def get(self, knowledge_base: str, session_id: str):
+        """Returns the session, loading it from SQLite if needed; None if unknown or expired."""
+        with self._lock:
+            self._expire()
+            key = (knowledge_base, session_id)
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            session = self._load(knowledge_base, session_id)
+            if session is not None:
+                self._put(session)
+            return session
+
+    def append(self, knowledge_base: str, session_id: str, human: str, ai: str):
+        """
+        Records a finished turn, folding the oldest one into the summary if
+        the window is full. Dropped if the session was deleted meanwhile.
+        """
+        with self._lock:
+            session = self._sessions.get((knowledge_base, session_id)) or self._load(knowledge_base, session_id)
+            if session is None:
+                return
+            if len(session.turns) == session.window:
+                session.summary = self._fold(session.summary, *session.turns[0])
+            session.turns.append((human, ai))
+            session.updated_at = time.time()
+            self._put(session)
+            self._save(session)
+
+    def delete(self, knowledge_base: str, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop((knowledge_base, session_id), None) is not None
+            if self._conn is not None:
+                found = self._conn.execute(
+                    "DELETE FROM sessions WHERE knowledge_base = ? AND id = ?", (knowledge_base, session_id)
+                ).rowcount > 0 or found
+                self._conn.commit()
+            return found
+
+    def stats(self) -> dict:
+        return {"sessions_in_memory": len(self._sessions), "persistent": self._conn is not None}
+
+    def _fold(self, summary: str, human: str, ai: str) -> str:
+        prefix = "Summary of the earlier conversation:"
+        items = [line for line in summary.splitlines()[1:] if line]
+        items.append(_summarize_turn(human, ai))
+        # Drop the oldest items until the summary fits its cap
+        while len(items) > 1 and sum(len(item) + 1 for item in items) > self.summary_chars:
+            items.pop(0)
+        return "\n".join([prefix] + items)
+
+    def _put(self, session: ChatSession) -> ChatSession:
+        key = (session.knowledge_base, session.id)
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def _expire(self):
+        # Reads move a session to the end without updating it, so LRU order
+        # is not age order; check them all
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, session in self._sessions.items() if session.updated_at < cutoff]
+        for key in expired:
+            del self._sessions[key]
+
+    def _load(self, knowledge_base: str, session_id: str):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT summary, turns, updated_at FROM sessions WHERE knowledge_base = ? AND id = ?",
+            (knowledge_base, session_id),
+        ).fetchone()
+        if row is None or row[2] < time.time() - self.ttl_seconds:
+            return None
+        summary, turns, updated_at = row
+        return ChatSession(id=session_id, knowledge_base=knowledge_base, window=self.window,
+                           turns=[tuple(turn) for turn in json.loads(turns)], summary=summary, updated_at=updated_at)
+
+    def _save(self, session: ChatSession):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (knowledge_base, id, summary, turns, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (session.knowledge_base, session.id, session.summary, json.dumps(list(session.turns)), session.updated_at),
+        )
+        self._conn.commit()
+
+
+session_store = SessionStore(
+    max_sessions=config.SESSION_MAX_SESSIONS,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+    window=config.SESSION_WINDOW_TURNS,
+    summary_chars=config.SESSION_SUMMARY_CHARS,
+    path=config.SESSION_DB_PATH or None,
+)
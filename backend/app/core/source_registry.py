@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+_COLUMNS = ("source", "kind", "content_hash", "chunks", "ingested_at", "updated_at")
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a file's bytes, read in 1 MB pieces."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_kind(source: str) -> str:
+    if source.startswith(("http://", "https://")):
+        return "website"
+    return os.path.splitext(source)[1].lstrip(".").lower() or "unknown"
+
+
+class SourceRegistry:
+    """
+    Every source (file name or URL) in a collection with the hash of the
+    content it was last ingested from and the ids of its chunks, so one
+    source can be skipped when unchanged, updated chunk by chunk, or deleted
+    without touching the others.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, kind TEXT, content_hash TEXT, "
+            "chunks INTEGER NOT NULL, ingested_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (source TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+            "PRIMARY KEY (source, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+
+    def list(self):
+        """Returns [{source, kind, content_hash, chunks, ingested_at, updated_at}], by source."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM sources ORDER BY source").fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def get(self, source: str):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def content_hash(self, source: str):
+        entry = self.get(source)
+        return entry["content_hash"] if entry else None
+
+    def chunk_ids(self, source: str) -> set:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,)).fetchall()
+        return {row[0] for row in rows}
+
+    def put(self, source: str, kind: str, content_hash, chunk_ids):
+        """Records the source's content hash and replaces its chunk ids."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sources (source, kind, content_hash, chunks, ingested_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(source) DO UPDATE SET kind = excluded.kind, "
+                "content_hash = excluded.content_hash, chunks = excluded.chunks, updated_at = excluded.updated_at",
+                (source, kind, content_hash, len(chunk_ids), now, now),
+            )
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO chunks (source, chunk_id) VALUES (?, ?)", [(source, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def delete(self, source: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
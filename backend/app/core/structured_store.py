@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_NUMBER_PREFIX = "$€£₹"
+_INT_RE = re.compile(r"^[+-]?\d+$")
+_FLOAT_RE = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+# Zero-padded codes ("007", ZIP codes, SKUs) would lose their padding as numbers
+_LEADING_ZERO_RE = re.compile(r"^[+-]?0\d")
+
+# Words that suggest a filter / aggregate question rather than a free-text one
+_STRUCTURED_HINTS = frozenset(
+    "how many count number total sum average avg mean max maximum min minimum "
+    "most least cheapest cheaper expensive highest lowest top under over below "
+    "above less more greater between list which all".split()
+)
+
+
+def _identifier(name: str) -> str:
+    ident = re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower() or "col"
+    return f"c_{ident}" if ident[0].isdigit() else ident
+
+
+def _clean_number(value: str) -> str:
+    return value.strip().lstrip(_NUMBER_PREFIX).replace(",", "").rstrip("%").strip()
+
+
+def _infer_type(values) -> str:
+    non_empty = [_clean_number(v) for v in values if v is not None and v.strip()]
+    if not non_empty or any(_LEADING_ZERO_RE.match(v) for v in non_empty):
+        return "TEXT"
+    if all(_INT_RE.match(v) for v in non_empty):
+        return "INTEGER"
+    if all(_FLOAT_RE.match(v) for v in non_empty):
+        return "REAL"
+    return "TEXT"
+
+
+def _convert(value, column_type):
+    if value is None or not value.strip():
+        return None
+    if column_type == "INTEGER":
+        return int(_clean_number(value))
+    if column_type == "REAL":
+        return float(_clean_number(value))
+    return value
+
+
+class StructuredStore:
+    """
+    Keeps every uploaded CSV as a typed SQLite table with an index on each
+    column, plus a catalog describing the tables for SQL generation.
+    Queries run on a connection that only authorizes reads.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _catalog (name TEXT PRIMARY KEY, source TEXT, columns TEXT, rows INTEGER)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def tables(self):
+        """Returns [{name, source, columns: [{name, original, type, free_text}], rows}]."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, source, columns, rows FROM _catalog").fetchall()
+        return [{"name": n, "source": s, "columns": json.loads(c), "rows": r} for n, s, c, r in rows]
+
+    def table_for_source(self, source: str):
+        for table in self.tables():
+            if table["source"] == source:
+                return table
+        return None
+
+    def ingest_csv(self, file_path: str, source: str) -> dict:
+        """
+        Loads the CSV into a table named after the file, replacing a previous
+        upload of the same file. Files whose names normalize to the same
+        table name (sales-2023.csv, sales_2023.csv) get a numeric suffix.
+        Returns the catalog entry.
+        """
+        with open(file_path, mode='r', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            originals = [name for name in (reader.fieldnames or []) if name is not None]
+            records = [row for row in reader]
+
+        idents, seen = [], set()
+        for original in originals:
+            ident = _identifier(original)
+            while ident in seen:
+                ident += "_"
+            seen.add(ident)
+            idents.append(ident)
+
+        columns = []
+        for original, ident in zip(originals, idents):
+            values = [row.get(original) for row in records]
+            column_type = _infer_type(values)
+            text_values = [v for v in values if v]
+            avg_words = sum(len(v.split()) for v in text_values) / len(text_values) if text_values else 0
+            columns.append({
+                "name": ident,
+                "original": original,
+                "type": column_type,
+                # Descriptive columns are the only ones worth embedding
+                "free_text": column_type == "TEXT" and avg_words >= 4,
+            })
+
+        column_sql = ", ".join(f'"{c["name"]}" {c["type"]}' for c in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        with self._lock:
+            table = self._table_name(source)
+            self._conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            self._conn.execute(f'CREATE TABLE "{table}" ({column_sql})')
+            self._conn.executemany(
+                f'INSERT INTO "{table}" VALUES ({placeholders})',
+                [[_convert(row.get(c["original"]), c["type"]) for c in columns] for row in records],
+            )
+            for c in columns:
+                if not c["free_text"]:
+                    self._conn.execute(f'CREATE INDEX "{table}__{c["name"]}" ON "{table}" ("{c["name"]}")')
+            self._conn.execute(
+                "INSERT OR REPLACE INTO _catalog (name, source, columns, rows) VALUES (?, ?, ?, ?)",
+                (table, source, json.dumps(columns), len(records)),
+            )
+            self._conn.commit()
+        return {"name": table, "source": source, "columns": columns, "rows": len(records)}
+
+    def _table_name(self, source: str) -> str:
+        # Caller holds self._lock. Keeps the table of a re-uploaded source.
+        row = self._conn.execute("SELECT name FROM _catalog WHERE source = ?", (source,)).fetchone()
+        if row:
+            return row[0]
+        base = table = _identifier(os.path.splitext(source)[0])
+        suffix = 2
+        while self._conn.execute("SELECT 1 FROM _catalog WHERE name = ?", (table,)).fetchone():
+            table = f"{base}_{suffix}"
+            suffix += 1
+        return table
+
+    def drop_table(self, name: str):
+        with self._lock:
+            self._conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            self._conn.execute("DELETE FROM _catalog WHERE name = ?", (name,))
+            self._conn.commit()
+
+    def clear(self):
+        for table in self.tables():
+            self.drop_table(table["name"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _selected(self, tables=None):
+        # Catalog entries for the given table names, or all of them
+        return [table for table in self.tables() if tables is None or table["name"] in tables]
+
+    def schema_description(self, tables=None) -> str:
+        """Schema text used in the SQL generation prompt, limited to `tables` when given."""
+        lines = []
+        for table in self._selected(tables):
+            cols = ", ".join(f'{c["name"]} {c["type"]} (was "{c["original"]}")' for c in table["columns"])
+            lines.append(f'TABLE {table["name"]} ({table["rows"]} rows, from {table["source"]}): {cols}')
+        return "\n".join(lines)
+
+    def looks_structured(self, question: str, tables=None) -> bool:
+        """
+        Cheap router: the question names a table or a column and asks for a
+        filter/aggregate, or names a non-free-text column directly. Only
+        `tables` are considered when given.
+        """
+        words = set(re.findall(r"[a-z0-9]+", question.lower()))
+        if not words:
+            return False
+        for table in self._selected(tables):
+            table_words = set(table["name"].split("_"))
+            table_words |= {word.rstrip("s") for word in table_words}
+            column_words = set()
+            for c in table["columns"]:
+                column_words |= set(c["name"].split("_"))
+            mentions_table = bool(words & table_words) or bool({w.rstrip("s") for w in words} & table_words)
+            mentions_column = bool(words & column_words)
+            if (mentions_table or mentions_column) and words & _STRUCTURED_HINTS:
+                return True
+        return False
+
+    def query(self, sql: str, max_rows: int = 50, timeout: float = 2.0, tables=None):
+        """
+        Runs a single read-only SELECT and returns (columns, rows). Anything
+        other than reads, or a read of a table outside `tables` when given,
+        is rejected by the SQLite authorizer.
+        """
+        statement = sql.strip().rstrip(";").strip()
+        if ";" in statement or not re.match(r"^(select|with)\b", statement, re.IGNORECASE):
+            raise ValueError("Only a single SELECT statement is allowed.")
+
+        allowed = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+
+        def authorize(action, table, *args):
+            if action not in allowed:
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ and tables is not None and table not in tables:
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._conn.set_authorizer(authorize)
+            # Abort runaway queries
+            self._conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+            try:
+                cursor = self._conn.execute(statement)
+                columns = [d[0] for d in cursor.description or []]
+                rows = cursor.fetchmany(max_rows)
+            finally:
+                self._conn.set_authorizer(None)
+                self._conn.set_progress_handler(None, 0)
+        return columns, rows
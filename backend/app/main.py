@@ -1,8 +1,24 @@
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from app.api import routes
+from app.core import config, metrics, rag_core
+from app.core.llm_gateway import gateway
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the models in the background so the API answers immediately
+    if config.WARM_UP_ON_STARTUP:
+        threading.Thread(target=rag_core.warm_up, name="warm-up", daemon=True).start()
+    yield
+    await gateway.aclose()
 
-app = FastAPI(title="RAG Chatbot")
+
+app = FastAPI(title="RAG Chatbot", lifespan=lifespan)
 
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
@@ -17,4 +33,28 @@ app.include_router(routes.router, prefix="/api")
 
 @app.get("/")
 def read_root():
-    return {"status": "API is running"}
\ No newline at end of file
+    return {"status": "API is running"}
+
+
+@app.get("/health")
+def liveness():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+def readiness():
+    """Readiness: models loaded, knowledge base open and Ollama has the model."""
+    components = rag_core.readiness()
+    ready = all(components.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "components": components},
+    )
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: per-stage chat and ingest latency histograms."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,83 @@
+"""
+Load test for /api/chat: fires N concurrent chats against the app with a
+fake LLM that sleeps for a fixed time, and checks that the total wall time is
+close to one generation rather than N of them (i.e. chats no longer
+serialize on the event loop).
+
+Run from the backend directory:
+    python -m benchmarks.chat_concurrency --requests 8 --delay 1.0
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from langchain_core.documents import Document
+from langchain_core.language_models.llms import LLM
+from langchain_core.retrievers import BaseRetriever
+
+# Keep the benchmark's knowledge base out of the real data directory
+os.environ.setdefault("KNOWLEDGE_BASE_DIR", tempfile.mkdtemp(prefix="bench_kb_"))
+os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+
+from app.core import rag_core
+from app.main import app
+
+
+class SlowFakeLLM(LLM):
+    """Stand-in for Ollama that answers after a fixed delay."""
+    delay: float = 1.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.delay)
+        return "fake answer"
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return "fake answer"
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="static context", metadata={"source": "bench"})]
+
+
+async def run(n_requests: int, delay: float):
+    rag_core.llm = SlowFakeLLM(delay=delay)
+    state = rag_core.knowledge_bases.get().current()
+    state.retriever = StaticRetriever()
+    state.chain = rag_core.get_conversational_rag_chain(state.retriever, state.structured_store)
+    state.has_documents = True
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/api/chat", json={"query": f"question {i}", "chat_history": []})
+            for i in range(n_requests)
+        ])
+        elapsed = time.perf_counter() - started
+
+    failures = [r.status_code for r in responses if r.status_code != 200]
+    serial_time = n_requests * delay
+    print(f"{n_requests} chats with {delay:.2f}s generations took {elapsed:.2f}s "
+          f"(serialized would be {serial_time:.2f}s, speedup x{serial_time / elapsed:.1f})")
+    if failures:
+        raise SystemExit(f"❌ {len(failures)} requests failed: {failures}")
+    if elapsed > serial_time / 2:
+        raise SystemExit("❌ Chats are still serializing.")
+    print("✅ Concurrent chats run in parallel.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.delay))
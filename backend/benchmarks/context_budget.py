@@ -0,0 +1,66 @@
+"""
+Measures how much the context builder shrinks the answer prompt: five
+neighbouring 1000-character chunks with 200 characters of overlap (what the
+splitter produces for a passage that matches well) plus a long chat history,
+before and after de-duplication, sentence trimming and history cutting.
+
+Run from the backend directory:
+    python -m benchmarks.context_budget --budget 800
+"""
+import argparse
+import random
+import time
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.core.context_builder import build_context, compact_history, estimate_tokens
+
+
+def _sentence(rng, words, topic=None):
+    chosen = rng.choices(words, k=rng.randint(8, 18))
+    if topic:
+        chosen[rng.randrange(len(chosen))] = topic
+    return " ".join(chosen).capitalize() + "."
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=800, help="context token budget")
+    parser.add_argument("--history-budget", type=int, default=400)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["training", "volume", "protein", "recovery", "sets", "reps", "intensity", "sleep", "week",
+             "muscle", "program", "rest", "load", "form", "progress", "cardio", "phase", "plan"]
+    text = " ".join(_sentence(rng, words, "deload" if rng.random() < 0.15 else None) for _ in range(60))
+    chunk_size, overlap = 1000, 200
+    chunks = [
+        Document(page_content=text[start:start + chunk_size], metadata={"source": "plan.pdf"})
+        for start in range(0, chunk_size * 4, chunk_size - overlap)
+    ][:5]
+    history = []
+    for i in range(args.turns):
+        history += [HumanMessage(content=f"Question {i} about the plan?"),
+                    AIMessage(content=" ".join(_sentence(rng, words) for _ in range(8)))]
+
+    started = time.perf_counter()
+    context = build_context(chunks, "When should I take a deload week?", args.budget)
+    compacted = compact_history(history, args.history_budget)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    before = sum(estimate_tokens(d.page_content) for d in chunks)
+    after = sum(estimate_tokens(d.page_content) for d in context)
+    history_before = sum(estimate_tokens(m.content) for m in history)
+    history_after = sum(estimate_tokens(m.content) for m in compacted)
+    print(f"Context: {before} -> {after} tokens ({len(chunks)} -> {len(context)} chunks)")
+    print(f"History: {history_before} -> {history_after} tokens ({len(history)} -> {len(compacted)} messages)")
+    print(f"Prompt tokens saved: {before + history_before - after - history_after} in {elapsed_ms:.1f} ms")
+    if after > args.budget or history_after > args.history_budget + 100:
+        raise SystemExit("❌ Budget exceeded.")
+    print("✅ Prompt fits the budget.")
+
+
+if __name__ == "__main__":
+    main()
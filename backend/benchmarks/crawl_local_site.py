@@ -0,0 +1,73 @@
+"""
+Crawls a generated site served by a local HTTP server: first run fetches
+every page through the sitemap, the second run should skip them all as
+unchanged (the server answers If-Modified-Since with 304).
+
+Run from the backend directory:
+    python -m benchmarks.crawl_local_site --pages 200
+"""
+import argparse
+import functools
+import os
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core import config
+from app.core.crawler import CrawlCache, Crawler
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def build_site(root: str, pages: int, port: int):
+    locs = []
+    for i in range(pages):
+        with open(os.path.join(root, f"page{i}.html"), "w") as f:
+            f.write(f"<html><head><title>Page {i}</title></head><body><p>Product {i} costs ${i * 10}.</p></body></html>")
+        locs.append(f"<url><loc>http://127.0.0.1:{port}/page{i}.html</loc></url>")
+    with open(os.path.join(root, "sitemap.xml"), "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(locs) + "</urlset>")
+
+
+def crawl(sitemap: str, cache: CrawlCache):
+    crawler = Crawler(cache=cache)
+    started = time.perf_counter()
+    pages = sum(1 for _ in crawler.pages(sitemap=sitemap))
+    crawler.commit()
+    return crawler, pages, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--host-delay", type=float, default=0.0, help="Per-host delay between request starts")
+    args = parser.parse_args()
+    config.CRAWL_PER_HOST_DELAY_SECONDS = args.host_delay
+
+    with tempfile.TemporaryDirectory() as root:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=root))
+        port = server.server_address[1]
+        build_site(root, args.pages, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        cache = CrawlCache(os.path.join(root, "crawl.sqlite"))
+        sitemap = f"http://127.0.0.1:{port}/sitemap.xml"
+
+        first, pages, elapsed = crawl(sitemap, cache)
+        print(f"First crawl: {pages} pages in {elapsed:.2f}s ({pages / elapsed:.1f} pages/sec), {first.failed} failed")
+        second, pages, elapsed = crawl(sitemap, cache)
+        print(f"Re-crawl: {pages} changed pages, {second.unchanged} unchanged in {elapsed:.2f}s")
+        server.shutdown()
+
+    if second.unchanged != args.pages:
+        raise SystemExit("❌ Re-crawl did not skip the unchanged pages.")
+    print("✅ Unchanged pages were skipped.")
+
+
+if __name__ == "__main__":
+    main()
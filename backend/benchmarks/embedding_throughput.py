@@ -0,0 +1,52 @@
+"""
+Measures embedding throughput (chunks/sec) for different batch sizes and
+worker counts on synthetic 1000-character chunks, to pick EMBED_BATCH_SIZE
+and EMBED_WORKERS for a machine.
+
+Run from the backend directory:
+    python -m benchmarks.embedding_throughput --chunks 2000 --batch-sizes 16 64 128 --workers 1 2 4
+"""
+import argparse
+import random
+import string
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+
+from app.core import config
+from app.core.embedding import EmbeddingEngine, Throughput
+
+
+def synthetic_chunks(n: int, size: int = 1000):
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(5000)]
+    for i in range(n):
+        text = ""
+        while len(text) < size:
+            text += rng.choice(words) + " "
+        yield Document(page_content=text[:size], metadata={"source": f"synthetic-{i}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 128])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    args = parser.parse_args()
+
+    embeddings = HuggingFaceEmbeddings(model_name=config.EMBEDDING_MODEL_NAME, model_kwargs={'device': 'cpu'})
+    print(f"{'workers':>8} {'batch':>6} {'chunks/sec':>11}")
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            engine = EmbeddingEngine(embeddings, batch_size=batch_size, workers=workers)
+            # Warm up the worker processes so model loading isn't measured
+            list(engine.embed_batches(synthetic_chunks(workers * batch_size)))
+            throughput = Throughput()
+            for batch, _ in engine.embed_batches(synthetic_chunks(args.chunks)):
+                throughput.add(len(batch))
+            engine.shutdown()
+            print(f"{workers:>8} {batch_size:>6} {throughput.per_second:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
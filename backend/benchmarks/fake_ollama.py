@@ -0,0 +1,142 @@
+"""
+Minimal stand-in for an Ollama server: /api/tags and a streaming
+/api/generate that returns canned tokens after a simulated latency. Like a
+real GPU, it decodes for all requests at once, so each request slows down
+when more than --parallel are in flight.
+
+Point the app at one or more of them to exercise the LLM gateway without a
+model. Run from the backend directory:
+    python -m benchmarks.fake_ollama --port 11500
+    OLLAMA_BASE_URLS=http://localhost:11500 uvicorn app.main:app
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core import config
+
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, port=0, first_token_seconds=0.2, tokens_per_second=50.0, tokens=40, parallel=2,
+                 model=config.LLM_MODEL):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.first_token_seconds = first_token_seconds
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.parallel = parallel
+        self.model = model
+        self.active = 0
+        self.peak = 0
+        self.served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def slowdown(self) -> float:
+        # Beyond `parallel` requests the same compute is shared by more of them
+        return max(1.0, self.active / self.parallel)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/api/tags":
+            return self._send_json({"error": "not found"}, 404)
+        self._send_json({"models": [{"name": self.server.model, "model": self.server.model}]})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            return self._send_json({"error": "not found"}, 404)
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            started = time.perf_counter()
+            time.sleep(server.first_token_seconds * server.slowdown())
+            words = [f"token{i} " for i in range(server.tokens)]
+            if request.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                decode_started = time.perf_counter()
+                for word in words:
+                    self._write_chunk({"model": server.model, "response": word, "done": False})
+                    time.sleep(server.slowdown() / server.tokens_per_second)
+                self._write_chunk(self._final(request, started, decode_started))
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                decode_started = time.perf_counter()
+                time.sleep(server.tokens * server.slowdown() / server.tokens_per_second)
+                final = self._final(request, started, decode_started)
+                final["response"] = "".join(words)
+                self._send_json(final)
+        finally:
+            with server.lock:
+                server.active -= 1
+                server.served += 1
+
+    def _final(self, request, started, decode_started):
+        now = time.perf_counter()
+        return {
+            "model": request.get("model", self.server.model),
+            "response": "",
+            "done": True,
+            "eval_count": self.server.tokens,
+            "eval_duration": int((now - decode_started) * 1e9),
+            "total_duration": int((now - started) * 1e9),
+        }
+
+    def _write_chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def start_fake_ollama(**kwargs) -> FakeOllama:
+    """Starts a fake Ollama on a background thread (a free port by default)."""
+    server = FakeOllama(**kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--first-token-seconds", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer")
+    parser.add_argument("--parallel", type=int, default=2, help="requests decoded at full speed")
+    args = parser.parse_args()
+
+    server = FakeOllama(args.port, args.first_token_seconds, args.tokens_per_second, args.tokens, args.parallel)
+    print(f"✅ Fake Ollama serving '{server.model}' at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Times BM25 queries on the lexical index over a synthetic corpus, including
+queries made of the most frequent terms (the longest posting lists), and
+checks the results against an exhaustive scan of the same postings: every
+hit must carry its exact score, and the top k may fall short of the
+exhaustive top k's total score only by --max-shortfall (searches that stop
+at max_scored). Also times reopening the index, as the registry does after
+evicting a knowledge base.
+
+Run from the backend directory:
+    python -m benchmarks.lexical_search --chunks 200000
+"""
+import argparse
+import heapq
+import os
+import random
+import string
+import tempfile
+import time
+
+from app.core.lexical_index import LexicalIndex, tokenize
+
+
+def _exhaustive(index, query):
+    """{doc_id: score} from every posting of the query terms."""
+    scores = {}
+    for term in set(tokenize(query)):
+        row = index._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+        if not row:
+            continue
+        idf = index._idf(row[0])
+        for doc_id, impact in index._conn.execute(
+            "SELECT d.id, p.impact FROM postings p JOIN docs d ON d.doc = p.doc WHERE p.term = ?", (term,)
+        ):
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * impact
+    return scores
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return f"p50 {timings[len(timings) // 2]:.2f} ms, p95 {timings[int(len(timings) * 0.95)]:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--words-per-chunk", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--checked", type=int, default=20, help="queries per kind compared with an exhaustive scan")
+    parser.add_argument("--target-ms", type=float, default=10.0, help="fail when a p95 exceeds this")
+    parser.add_argument("--max-shortfall", type=float, default=0.10,
+                        help="largest allowed fraction of the exhaustive top k's total score missed")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Zipf-like vocabulary so some terms are common and most are rare
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(50_000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lexical.sqlite")
+        index = LexicalIndex(path)
+        started = time.perf_counter()
+        batch_ids, batch_texts = [], []
+        for i in range(args.chunks):
+            batch_ids.append(f"chunk-{i}")
+            batch_texts.append(" ".join(rng.choices(vocabulary, weights, k=args.words_per_chunk)) + f" sku{i}")
+            if len(batch_ids) == 1000:
+                index.add(batch_ids, batch_texts)
+                batch_ids, batch_texts = [], []
+        if batch_ids:
+            index.add(batch_ids, batch_texts)
+        print(f"Indexed {len(index)} chunks in {time.perf_counter() - started:.1f}s")
+        index.close()
+
+        started = time.perf_counter()
+        index = LexicalIndex(path)
+        print(f"Reopened in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        kinds = {
+            # Terms drawn with the corpus' own frequencies, so common terms dominate
+            "zipf": lambda: " ".join(rng.choices(vocabulary, weights, k=3)) + f" sku{rng.randrange(args.chunks)}",
+            "one frequent term": lambda: rng.choice(vocabulary[:10]),
+            "three frequent terms": lambda: " ".join(rng.sample(vocabulary[:10], 3)),
+            "rare terms": lambda: " ".join(rng.choices(vocabulary[100:], k=3)) + f" sku{rng.randrange(args.chunks)}",
+        }
+        for kind, make_query in kinds.items():
+            timings, exact, shortfall = [], 0, 0.0
+            for i in range(args.queries):
+                query = make_query()
+                started = time.perf_counter()
+                hits = index.search(query, k=20)
+                timings.append((time.perf_counter() - started) * 1000)
+                if i < args.checked:
+                    scores = _exhaustive(index, query)
+                    best = heapq.nlargest(20, scores.values())
+                    if any(abs(score - scores[doc_id]) > 1e-9 for doc_id, score in hits):
+                        failures.append(f"{kind}: {query!r} returned a wrong score")
+                    exact += [round(score, 9) for _, score in hits] == [round(score, 9) for score in best]
+                    if best:
+                        shortfall = max(shortfall, 1 - sum(score for _, score in hits) / sum(best))
+            checked = min(args.checked, args.queries)
+            print(f"{kind}: {_percentiles(timings)}, {exact}/{checked} exact, "
+                  f"worst shortfall {shortfall * 100:.1f}%")
+            if shortfall > args.max_shortfall:
+                failures.append(f"{kind}: top 20 misses {shortfall * 100:.1f}% of the exhaustive score")
+            if sorted(timings)[int(len(timings) * 0.95)] > args.target_ms:
+                failures.append(f"{kind}: p95 above {args.target_ms} ms")
+        index.close()
+
+    if failures:
+        raise SystemExit("❌ " + "\n❌ ".join(failures))
+    print("✅ Lexical search is within the latency target and close to an exhaustive scan.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Fires a burst of concurrent generations at fake Ollama servers, first
+straight at one server (no limit, like the old shared client) and then
+through the LLM gateway spread over two servers. Reports time to first
+token, total latency, 429 rejections, how the work was split across
+instances and whether a small tenant still got served during a large
+tenant's burst.
+
+Run from the backend directory:
+    python -m benchmarks.llm_gateway --requests 60 --max-in-flight 2 --max-queue 24
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core.llm_gateway import GatewayBusy, GatewayOllama, LLMGateway, queue_key
+from benchmarks.fake_ollama import start_fake_ollama
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else float("nan")
+
+
+def _report(name, results):
+    first = [r["first_token"] for r in results if "first_token" in r]
+    total = [r["total"] for r in results if "total" in r]
+    print(f"{name:<22} ok {len(total):3d}   rejected {sum('rejected' in r for r in results):3d}   "
+          f"first token p50 {statistics.median(first):5.2f}s p95 {_percentile(first, 0.95):5.2f}s   "
+          f"total p50 {statistics.median(total):5.2f}s p95 {_percentile(total, 0.95):5.2f}s")
+
+
+async def direct_burst(url, model, n):
+    async def one(client):
+        started = time.perf_counter()
+        result = {}
+        async with client.stream("POST", f"{url}/api/generate", json={"model": model, "prompt": "hi"}) as response:
+            async for line in response.aiter_lines():
+                if line and "first_token" not in result:
+                    result["first_token"] = time.perf_counter() - started
+        result["total"] = time.perf_counter() - started
+        return result
+
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None)) as client:
+        return await asyncio.gather(*[one(client) for _ in range(n)])
+
+
+async def gateway_burst(gateway, model, n):
+    llm = GatewayOllama(model=model, gateway=gateway)
+
+    async def one(i):
+        # Three quarters of the burst comes from one tenant
+        tenant = "small-team" if i % 4 == 0 else "big-team"
+        started = time.perf_counter()
+        result = {"tenant": tenant}
+        with queue_key(tenant):
+            try:
+                async for _ in llm.astream("hi"):
+                    result.setdefault("first_token", time.perf_counter() - started)
+            except GatewayBusy as e:
+                result["rejected"] = e.retry_after
+                return result
+        result["total"] = time.perf_counter() - started
+        return result
+
+    return await asyncio.gather(*[one(i) for i in range(n)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--max-in-flight", type=int, default=2, help="per Ollama instance")
+    parser.add_argument("--max-queue", type=int, default=24)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+
+    servers = [start_fake_ollama(tokens=args.tokens, tokens_per_second=args.tokens_per_second, parallel=2)
+               for _ in range(2)]
+    model = servers[0].model
+
+    direct = asyncio.run(direct_burst(servers[0].url, model, args.requests))
+    _report("direct, one instance", direct)
+    for server in servers:
+        server.peak = server.served = 0
+
+    gateway = LLMGateway([s.url for s in servers], max_in_flight=args.max_in_flight, max_queue=args.max_queue)
+    through_gateway = asyncio.run(gateway_burst(gateway, model, args.requests))
+    _report("gateway, 2 instances", through_gateway)
+
+    for tenant in ("big-team", "small-team"):
+        served = [r["first_token"] for r in through_gateway if r["tenant"] == tenant and "total" in r]
+        print(f"  {tenant:<11} served {len(served):3d}   mean first token {statistics.mean(served) if served else 0:5.2f}s")
+    print(f"  per instance: {[s.served for s in servers]} served, peak in flight {[s.peak for s in servers]}")
+    retry_after = sorted({r["rejected"] for r in through_gateway if "rejected" in r})
+    print(f"  Retry-After values: {retry_after}")
+
+    slots = 2 * args.max_in_flight
+    expected_rejections = max(0, args.requests - slots - args.max_queue)
+    rejected = sum("rejected" in r for r in through_gateway)
+    if any(s.peak > args.max_in_flight for s in servers):
+        raise SystemExit("❌ An instance ran more generations than max_in_flight.")
+    if rejected != expected_rejections:
+        raise SystemExit(f"❌ Expected {expected_rejections} rejections, got {rejected}.")
+    if not all(s.served for s in servers):
+        raise SystemExit("❌ Generations were not spread across instances.")
+    print("✅ Generations capped per instance, balanced, and the overflow rejected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures what the cross-encoder rerank stage costs and saves: for a few
+candidate set sizes, the time to score every (question, chunk) pair in one
+batch (cold), the same call again with the pair scores cached (warm), and
+the prompt tokens of the reranked top-n against passing the first k
+candidates straight through. Each question has exactly one chunk that
+answers it, hidden among distractors on the same topic.
+
+Needs sentence-transformers and downloads the model on first run.
+Run from the backend directory:
+    python -m benchmarks.rerank --model cross-encoder/ms-marco-MiniLM-L-6-v2 --candidates 10 20 40
+"""
+import argparse
+import random
+import statistics
+import time
+
+from langchain_core.documents import Document
+
+from app.core.context_builder import estimate_tokens
+from app.core.reranker import CrossEncoderReranker
+
+TOPICS = [
+    ("How many sets should I do for hypertrophy?",
+     "For hypertrophy, 10 to 20 hard sets per muscle group per week works for most lifters."),
+    ("When should I take a deload week?",
+     "Take a deload week every 4 to 8 weeks, or sooner when performance drops for several sessions."),
+    ("How much protein do I need per day?",
+     "Aim for about 1.6 to 2.2 grams of protein per kilogram of body weight each day."),
+    ("How long should I rest between heavy sets?",
+     "Rest 2 to 5 minutes between heavy compound sets so strength recovers fully."),
+]
+FILLER = ["training", "volume", "program", "muscle", "recovery", "sleep", "load", "week", "progress", "form"]
+
+
+def _distractor(rng):
+    return " ".join(rng.choices(FILLER, k=rng.randint(25, 40))).capitalize() + "."
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--k", type=int, default=5, help="chunks passed without reranking")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    reranker = CrossEncoderReranker(args.model, top_n=args.top_n, batch_size=args.batch_size)
+    reranker.model  # load outside the timings
+
+    failures = []
+    for n in args.candidates:
+        cold, warm, found, found_without = [], [], 0, 0
+        tokens_before, tokens_after = [], []
+        for question, answer in TOPICS:
+            documents = [Document(page_content=_distractor(rng)) for _ in range(n - 1)]
+            # The answer sits outside the first k, where plain top-k drops it
+            documents.insert(min(n - 1, args.k + rng.randrange(max(1, n - args.k))), Document(page_content=answer))
+
+            started = time.perf_counter()
+            reranked = reranker.rerank(question, documents)
+            cold.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            reranker.rerank(question, documents)
+            warm.append((time.perf_counter() - started) * 1000)
+
+            found += any(doc.page_content == answer for doc in reranked)
+            found_without += any(doc.page_content == answer for doc in documents[:args.k])
+            tokens_before.append(sum(estimate_tokens(d.page_content) for d in documents[:args.k]))
+            tokens_after.append(sum(estimate_tokens(d.page_content) for d in reranked))
+
+        print(f"{n:3d} candidates: rerank {statistics.mean(cold):7.1f} ms cold, {statistics.mean(warm):5.2f} ms cached"
+              f"   answer in prompt {found}/{len(TOPICS)} (top-{args.k} without rerank: {found_without})"
+              f"   prompt {statistics.mean(tokens_before):.0f} -> {statistics.mean(tokens_after):.0f} tokens")
+        if found < len(TOPICS):
+            failures.append(n)
+
+    print(f"Stats: {reranker.stats()}")
+    if failures:
+        raise SystemExit(f"❌ The reranker missed the answer with {failures} candidates.")
+    print("✅ Reranking kept the answer in a shorter prompt.")
+
+
+if __name__ == "__main__":
+    main()
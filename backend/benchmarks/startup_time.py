@@ -0,0 +1,38 @@
+"""
+Measures how long `import app.main` takes in a fresh interpreter and fails
+if it exceeds the startup budget. Model loading happens lazily / in the
+background, so this is the time before uvicorn can answer `/` and `/health`.
+
+Run from the backend directory:
+    python -m benchmarks.startup_time --runs 5 --budget 3.0
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_import() -> float:
+    started = time.perf_counter()
+    # Importing does not run the lifespan hook, so no warm-up is included
+    subprocess.run([sys.executable, "-c", "import app.main"], check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=3.0, help="Maximum median import time in seconds")
+    args = parser.parse_args()
+
+    timings = [time_import() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"import app.main: median {median:.2f}s, min {min(timings):.2f}s, max {max(timings):.2f}s")
+    if median > args.budget:
+        raise SystemExit(f"❌ Startup import time {median:.2f}s exceeds the {args.budget:.2f}s budget.")
+    print("✅ Within the startup budget.")
+
+
+if __name__ == "__main__":
+    main()
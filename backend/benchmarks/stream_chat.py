@@ -0,0 +1,129 @@
+"""
+Drives /api/chat/stream with a FakeStreamingListLLM (installed through
+rag_core.set_llm) and checks the server-sent events: 'sources' first, then
+the answer as 'token' frames, then one 'done' frame whose answer matches the
+tokens. Also checks that a generation failing midway ends in an 'error'
+frame, that a full LLM queue reports its retry_after, and that a client
+disconnecting mid-answer releases the knowledge base snapshot.
+
+Run from the backend directory:
+    python -m benchmarks.stream_chat --answer "Deload every four to eight weeks." --sleep 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeStreamingListLLM
+from langchain_core.language_models.llms import LLM
+from langchain_core.retrievers import BaseRetriever
+
+# Keep the benchmark's knowledge base out of the real data directory
+os.environ.setdefault("KNOWLEDGE_BASE_DIR", tempfile.mkdtemp(prefix="bench_kb_"))
+os.environ.setdefault("ANSWER_CACHE_SIZE", "0")
+
+from app.api import routes
+from app.core import rag_core
+from app.core.llm_gateway import GatewayBusy
+from app.main import app
+
+QUESTION = "When should I take a deload week?"
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [Document(page_content="Deload every four to eight weeks.", metadata={"source": "bench"})]
+
+
+class BusyLLM(LLM):
+    """Stand-in for a gateway whose queue is full."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "busy-fake"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        raise GatewayBusy(7)
+
+
+def _parse(body: str):
+    """[(event, data)] from an SSE body."""
+    events = []
+    for frame in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _stream(client):
+    started = time.perf_counter()
+    response = await client.post("/api/chat/stream", json={"query": QUESTION, "include_timings": True})
+    elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise SystemExit(f"❌ /chat/stream returned {response.status_code}: {response.text}")
+    return _parse(response.text), elapsed
+
+
+async def run(answer: str, sleep: float):
+    state = rag_core.knowledge_bases.get().current()
+    state.retriever = StaticRetriever()
+    state.has_documents = True
+    failures = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        rag_core.set_llm(FakeStreamingListLLM(responses=[answer], sleep=sleep))
+        events, elapsed = await _stream(client)
+        names = [name for name, _ in events]
+        tokens = "".join(data["token"] for name, data in events if name == "token")
+        done = events[-1][1] if names and names[-1] == "done" else {}
+        print(f"answer: {len(events)} events in {elapsed * 1000:.0f} ms, {names.count('token')} tokens, "
+              f"first token {done.get('time_to_first_token_ms')} ms, total {done.get('total_ms')} ms")
+        if names[:1] != ["sources"] or names[-1:] != ["done"] or set(names[1:-1]) != {"token"}:
+            failures.append(f"expected sources, token..., done; got {names}")
+        elif tokens != answer or done["answer"] != answer:
+            failures.append(f"tokens {tokens!r} and done answer {done['answer']!r} differ from {answer!r}")
+
+        rag_core.set_llm(FakeStreamingListLLM(responses=[answer], sleep=sleep, error_on_chunk_number=3))
+        events, _ = await _stream(client)
+        names = [name for name, _ in events]
+        print(f"failing LLM: {names}")
+        if names[:1] != ["sources"] or names[-1:] != ["error"] or "done" in names:
+            failures.append(f"a failed generation should end in an error frame; got {names}")
+
+        rag_core.set_llm(BusyLLM())
+        events, _ = await _stream(client)
+        print(f"busy LLM: {events[-1] if events else None}")
+        if not events or events[-1][0] != "error" or events[-1][1].get("retry_after") != 7:
+            failures.append(f"a full LLM queue should end in an error frame with retry_after; got {events}")
+
+    # A client that disconnects mid-answer: the response closes the generator
+    # from another task, which must still release the snapshot
+    rag_core.set_llm(FakeStreamingListLLM(responses=[answer * 20], sleep=sleep))
+    knowledge_base = rag_core.knowledge_bases.get()
+    stream = routes._stream_chat_events(knowledge_base, {"input": QUESTION, "chat_history": [], "filters": None})
+    await stream.__anext__()
+    await stream.__anext__()
+    await asyncio.create_task(stream.aclose())
+    await asyncio.sleep(0.1)
+    readers = knowledge_base.current().readers
+    print(f"disconnect: {readers} snapshot readers left")
+    if readers:
+        failures.append(f"{readers} snapshot readers leaked after a disconnect")
+
+    if failures:
+        raise SystemExit("❌ " + "\n❌ ".join(failures))
+    print("✅ Streaming events arrive in order and failures end in an error frame.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answer", default="Deload every four to eight weeks.")
+    parser.add_argument("--sleep", type=float, default=0.01, help="seconds between streamed characters")
+    args = parser.parse_args()
+    asyncio.run(run(args.answer, args.sleep))
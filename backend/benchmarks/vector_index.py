@@ -0,0 +1,85 @@
+"""
+Recall@k vs latency vs memory for dense search on a synthetic corpus of
+clustered, normalized 384-dim vectors (shaped like MiniLM embeddings):
+
+- exact float32 brute force (the ground truth),
+- Chroma HNSW for a few (M, ef_construction, ef_search) settings, which
+  are what HNSW_M, HNSW_EF_CONSTRUCTION and HNSW_EF_SEARCH tune.
+
+Memory is the float vectors plus an estimate of the HNSW neighbour links.
+
+Run from the backend directory:
+    python -m benchmarks.vector_index --vectors 50000 --queries 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+HNSW_SETTINGS = [(16, 100, 10), (16, 100, 100), (32, 200, 200)]
+
+
+def synthetic_corpus(n, dim, seed=0, noise=0.6):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure(name, search, queries, truth, k, memory_bytes):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(found[:k]) & expected)
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{name:<34} recall@{k} {hits / (k * len(queries)):.3f}   p50 {statistics.median(latencies):7.2f} ms"
+          f"   p95 {p95:7.2f} ms   memory {memory_bytes / 2**20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.6,
+                        help="spread of vectors around their topic centre")
+    args = parser.parse_args()
+
+    vectors = synthetic_corpus(args.vectors, args.dim, noise=args.noise)
+    queries = synthetic_corpus(args.queries, args.dim, seed=1, noise=args.noise)
+    ids = [f"chunk-{i}" for i in range(args.vectors)]
+    k = args.k
+
+    truth = [set(ids[i] for i in np.argsort(-(vectors @ q))[:k]) for q in queries]
+    measure("float32 brute force", lambda q: [ids[i] for i in np.argsort(-(vectors @ q))[:k]],
+            queries, truth, k, vectors.nbytes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=os.path.join(tmp, "chroma"))
+        for m, ef_construction, ef_search in HNSW_SETTINGS:
+            collection = client.create_collection(
+                f"bench_m{m}_c{ef_construction}_s{ef_search}", embedding_function=None,
+                configuration={"hnsw": {"max_neighbors": m, "ef_construction": ef_construction,
+                                        "ef_search": ef_search}},
+            )
+            started = time.perf_counter()
+            for start in range(0, args.vectors, 5000):
+                collection.add(ids=ids[start:start + 5000], embeddings=vectors[start:start + 5000])
+            build = time.perf_counter() - started
+            # Float vectors plus about M * 2 neighbour links per node (estimate)
+            memory = vectors.nbytes + args.vectors * m * 2 * 4
+            measure(f"HNSW M={m} efC={ef_construction} efS={ef_search} ({build:.0f}s build)",
+                    lambda q, collection=collection: collection.query(query_embeddings=[q], n_results=k)["ids"][0],
+                    queries, truth, k, memory)
+
+
+if __name__ == "__main__":
+    main()
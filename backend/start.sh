@@ -19,10 +19,10 @@ while ! curl -s http://localhost:11434/ > /dev/null; do
 done
 echo "\nOllama server is running."
 
-# Pull the model if it's not already there
-echo "Pulling model gemma:2b-instruct-q4_0..."
-ollama pull gemma:2b-instruct-q4_0
-echo "Model pull complete."
+# Pull the model in the background so the API starts right away.
+# /ready reports "llm": false until the pull has finished.
+echo "Pulling model gemma:2b-instruct-q4_0 in the background..."
+(ollama pull gemma:2b-instruct-q4_0 && echo "Model pull complete.") &
 
 # Start the FastAPI application
 echo "Starting FastAPI server..."
@@ -1,40 +1,48 @@
+"""
+Evaluates the chatbot on a golden dataset: quality with RAGAs, speed with
+latency percentiles and throughput.
+
+Questions are sent concurrently and every response is appended to a JSONL
+cache as soon as it arrives, so an interrupted run resumes where it stopped.
+
+    python evaluate.py --concurrency 8
+    python evaluate.py --stub --skip-ragas          # offline, against a stub chat server
+    python evaluate.py --run-id v1.4 --max-p95 20 --min-score faithfulness=0.7   # release gate
+"""
+import argparse
+import hashlib
+import json
 import os
-import requests
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
 import pandas as pd
-from datasets import Dataset
-from ragas import evaluate
-from ragas.metrics import (
-    faithfulness,
-    answer_relevancy,
-    context_recall,
-    context_precision,
-)
-# --- To use Ollama as the RAGAs judge ---
-from ragas.llms import LangchainLLM
-from langchain_ollama.llms import Ollama
+import requests
 
 # --- Configuration ---
 # Make sure your chatbot is running and accessible at this URL
 CHATBOT_API_URL = "http://localhost:8000/api/chat"
 # Path to your evaluation dataset
 EVAL_DATASET_PATH = "evaluation_dataset.csv"
+# Chatbot responses already collected; delete it to query everything again
+RESPONSE_CACHE_PATH = "evaluation_responses.jsonl"
 # Ollama model to use for RAGAs evaluation
 RAGAS_OLLAMA_MODEL = "gemma:2b-instruct-q4_0" # Make sure this model is pulled in Ollama
+REQUEST_TIMEOUT = 120
 
-# --- Configure RAGAs to use your local Ollama ---
-# Initialize the Langchain LLM with your Ollama model
-ollama_llm = Ollama(model=RAGAS_OLLAMA_MODEL)
-# Wrap it for RAGAs
-ragas_langchain_llm = LangchainLLM(llm=ollama_llm)
 
 # --- Load Your Golden Dataset ---
-print(f"Loading evaluation dataset from: {EVAL_DATASET_PATH}")
-try:
+def load_dataset(path):
+    print(f"Loading evaluation dataset from: {path}")
     # Adjust reading based on your file format (CSV or JSON)
-    if EVAL_DATASET_PATH.endswith(".csv"):
-        eval_df = pd.read_csv(EVAL_DATASET_PATH)
-    elif EVAL_DATASET_PATH.endswith(".json"):
-        eval_df = pd.read_json(EVAL_DATASET_PATH)
+    if path.endswith(".csv"):
+        eval_df = pd.read_csv(path)
+    elif path.endswith(".json"):
+        eval_df = pd.read_json(path)
     else:
         raise ValueError("Unsupported dataset file format. Use .csv or .json")
 
@@ -55,76 +63,184 @@ try:
          # Basic example: treat the whole string as one context item
         eval_df['ground_truth_context'] = eval_df['ground_truth_context'].apply(lambda x: [x] if x else [])
 
-
     print(f"Loaded {len(eval_df)} evaluation examples.")
+    return eval_df
+
 
-except FileNotFoundError:
-    print(f"Error: Evaluation dataset not found at {EVAL_DATASET_PATH}")
-    exit()
-except Exception as e:
-    print(f"Error loading or processing dataset: {e}")
-    exit()
+# --- Response cache ---
+class ResponseCache:
+    """
+    Append-only JSONL file of chatbot responses keyed by (scope, question),
+    where the scope is the API URL (or "stub") plus the run id, so a new
+    release evaluated against the same URL is queried afresh.
+    Each response is flushed as soon as it arrives, so a crash loses at most
+    the questions that were still in flight. Failed calls are not cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # half-written last line from an interrupted run
+                    self.entries[entry["key"]] = entry
+
+    @staticmethod
+    def key(scope, question):
+        return hashlib.sha256(f"{scope}\n{question}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, entry):
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
 
 
 # --- Function to Query Your Chatbot ---
-def get_chatbot_response(question):
-    """Calls your chatbot API and returns the answer and retrieved contexts."""
+_local = threading.local()
+
+
+def _session():
+    # One keep-alive connection pool per worker thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def get_chatbot_response(api_url, question):
+    """
+    Calls your chatbot API and returns the answer, retrieved contexts,
+    client-side latency and the server's stage timings. `error` is set
+    instead when the call fails.
+    """
+    started = time.perf_counter()
     try:
-        response = requests.post(CHATBOT_API_URL, json={"query": question, "chat_history": []}, timeout=120) # Increased timeout
+        response = _session().post(
+            api_url,
+            json={"query": question, "chat_history": [], "include_timings": True},
+            timeout=REQUEST_TIMEOUT,
+        )
         response.raise_for_status()
         data = response.json()
-        contexts = [str(source.get('content', '')) for source in data.get('sources', [])] # Ensure contexts are strings
-        answer = str(data.get('answer', '')) # Ensure answer is a string
-        return {"answer": answer, "contexts": contexts}
     except requests.exceptions.Timeout:
-        print(f"API call timed out for question: '{question}'")
-        return {"answer": "Error: API call timed out.", "contexts": []}
+        return {"error": "API call timed out."}
     except requests.exceptions.RequestException as e:
-        print(f"API call failed for question '{question}': {e}")
-        return {"answer": "Error: API call failed.", "contexts": []}
+        return {"error": f"API call failed: {e}"}
     except Exception as e:
-        print(f"Unexpected error processing question '{question}': {e}")
-        return {"answer": "Error: Unexpected processing error.", "contexts": []}
+        return {"error": f"Unexpected processing error: {e}"}
+    return {
+        "answer": str(data.get('answer', '')), # Ensure answer is a string
+        "contexts": [str(source.get('content', '')) for source in data.get('sources', [])], # Ensure contexts are strings
+        "latency_seconds": time.perf_counter() - started,
+        "cached_by_server": bool(data.get("cached")),
+        "server_timings": data.get("timings"),
+    }
+
 
 # --- Run Chatbot for Each Question ---
-print("Querying chatbot for each question in the dataset...")
-results_list = []
-for index, row in eval_df.iterrows():
-    question = str(row['question']) # Ensure question is string
-    print(f"  Processing question {index+1}/{len(eval_df)}: {question[:50]}...")
-    response_data = get_chatbot_response(question)
-    results_list.append({
-        "question": question,
-        "answer": response_data['answer'],
-        "contexts": response_data['contexts'],
-        "ground_truth": str(row['ground_truth_answer']) # RAGAs expects 'ground_truth'
-        # Context Recall requires this column, ensure it's a list of strings
-        # "ground_truth_context": row['ground_truth_context']
-    })
-
-results_df = pd.DataFrame(results_list)
-
-# --- Convert to Hugging Face Dataset ---
-print("Converting results to RAGAs dataset format...")
-try:
-    ragas_dataset = Dataset.from_pandas(results_df)
-except Exception as e:
-    print(f"Error converting DataFrame to Dataset: {e}")
-    print("DataFrame sample:")
-    print(results_df.head())
-    exit()
+def collect_responses(eval_df, api_url, cache, concurrency, scope):
+    """
+    Queries the chatbot for every question not already in the cache, with up
+    to `concurrency` requests in flight. Returns the wall time spent and the
+    number of questions answered in this run.
+    """
+    questions = list(dict.fromkeys(str(q) for q in eval_df['question']))
+    pending = [q for q in questions if cache.get(ResponseCache.key(scope, q)) is None]
+    print(f"{len(questions) - len(pending)} responses cached, querying {len(pending)} questions "
+          f"with concurrency {concurrency}...")
+
+    answered = failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(get_chatbot_response, api_url, q): q for q in pending}
+        for future in as_completed(futures):
+            question = futures[future]
+            response_data = future.result()
+            if "error" in response_data:
+                failed += 1
+                print(f"  ❌ {response_data['error']} ({question[:50]})")
+                continue
+            answered += 1
+            cache.put({"key": ResponseCache.key(scope, question), "question": question, **response_data})
+            print(f"  [{answered + failed}/{len(pending)}] {response_data['latency_seconds']:.2f}s  {question[:50]}")
+    elapsed = time.perf_counter() - started
+    if failed:
+        print(f"{failed} questions failed and will be retried on the next run.")
+    return elapsed, answered
+
+
+# --- Latency report ---
+def latency_report(responses, elapsed, answered):
+    # Answers from the server's own answer cache skip retrieval and generation;
+    # they are reported apart so they do not flatter the percentiles
+    latencies = np.array([r["latency_seconds"] for r in responses if not r.get("cached_by_server")])
+    cached = [r["latency_seconds"] for r in responses if r.get("cached_by_server")]
+    report = {"responses": len(responses), "server_cache_hits": len(cached)}
+    if cached:
+        report["server_cache_hit_mean_seconds"] = round(float(np.mean(cached)), 3)
+    if len(latencies):
+        report.update({
+            "latency_p50_seconds": round(float(np.percentile(latencies, 50)), 3),
+            "latency_p95_seconds": round(float(np.percentile(latencies, 95)), 3),
+            "latency_p99_seconds": round(float(np.percentile(latencies, 99)), 3),
+            "latency_mean_seconds": round(float(latencies.mean()), 3),
+        })
+    # Throughput only means something for questions actually sent this run
+    if answered and elapsed > 0:
+        report["throughput_qps"] = round(answered / elapsed, 3)
+
+    # Average of the server's own per-stage breakdown, where available
+    stages = {}
+    for r in responses:
+        for stage, ms in ((r.get("server_timings") or {}).get("stages_ms") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+    if stages:
+        report["server_stage_mean_ms"] = {stage: round(sum(v) / len(v), 1) for stage, v in stages.items()}
+    return report
+
 
 # --- Define Metrics & Run Evaluation ---
-# Context Recall needs 'ground_truth_context' in the dataset. Uncomment if you have it.
-metrics_to_evaluate = [
-    faithfulness,
-    answer_relevancy,
-    context_precision,
-    # context_recall,
-]
-
-print("Running RAGAs evaluation (this may take a while)...")
-try:
+def run_ragas(results_df):
+    # Imported here so latency-only and offline runs don't need RAGAs/Ollama
+    from datasets import Dataset
+    from ragas import evaluate
+    from ragas.metrics import (
+        faithfulness,
+        answer_relevancy,
+        context_recall,
+        context_precision,
+    )
+    # --- To use Ollama as the RAGAs judge ---
+    from ragas.llms import LangchainLLM
+    from langchain_ollama.llms import Ollama
+
+    # --- Configure RAGAs to use your local Ollama ---
+    # Initialize the Langchain LLM with your Ollama model
+    ollama_llm = Ollama(model=RAGAS_OLLAMA_MODEL)
+    # Wrap it for RAGAs
+    ragas_langchain_llm = LangchainLLM(llm=ollama_llm)
+
+    # --- Convert to Hugging Face Dataset ---
+    print("Converting results to RAGAs dataset format...")
+    ragas_dataset = Dataset.from_pandas(results_df[["question", "answer", "contexts", "ground_truth"]])
+
+    # Context Recall needs 'ground_truth_context' in the dataset. Uncomment if you have it.
+    metrics_to_evaluate = [
+        faithfulness,
+        answer_relevancy,
+        context_precision,
+        # context_recall,
+    ]
+
+    print("Running RAGAs evaluation (this may take a while)...")
     # Pass the configured Ollama LLM to RAGAs
     score = evaluate(
         ragas_dataset,
@@ -139,18 +255,141 @@ try:
     print("\n--- Evaluation Results ---")
     print(evaluation_results_df)
 
-    # Calculate and print average scores
-    print("\n--- Average Scores ---")
-    average_scores = evaluation_results_df[[m.name for m in metrics_to_evaluate]].mean()
-    print(average_scores)
-
-
     # Save results
     results_filename = "evaluation_results.csv"
     evaluation_results_df.to_csv(results_filename, index=False)
     print(f"\nResults saved to {results_filename}")
 
-except Exception as e:
-    print(f"An error occurred during RAGAs evaluation: {e}")
-    import traceback
-    traceback.print_exc()
\ No newline at end of file
+    average_scores = evaluation_results_df[[m.name for m in metrics_to_evaluate]].mean()
+    return {name: round(float(value), 4) for name, value in average_scores.items()}
+
+
+# --- Offline stub ---
+def start_stub_server(eval_df, delay):
+    """
+    Serves a fake /api/chat on a free local port that answers each dataset
+    question with its ground truth after `delay` seconds. Returns its URL.
+    """
+    truths = {str(row['question']): row for _, row in eval_df.iterrows()}
+
+    class StubChatHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            row = truths.get(payload["query"])
+            body = json.dumps({
+                "answer": str(row['ground_truth_answer']) if row is not None else "I don't know.",
+                "sources": [{"content": c, "metadata": {"source": "stub"}}
+                            for c in (row['ground_truth_context'] if row is not None else [])],
+                "cached": False,
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api/chat"
+
+
+def _parse_min_scores(values):
+    thresholds = {}
+    for value in values:
+        name, _, threshold = value.partition("=")
+        thresholds[name] = float(threshold)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=CHATBOT_API_URL)
+    parser.add_argument("--dataset", default=EVAL_DATASET_PATH)
+    parser.add_argument("--cache", default=RESPONSE_CACHE_PATH, help="JSONL file of collected responses")
+    parser.add_argument("--run-id", default="",
+                        help="cached responses are reused only within the same run id; use a new one per release")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions in flight at once")
+    parser.add_argument("--skip-ragas", action="store_true", help="only measure latency and throughput")
+    parser.add_argument("--stub", action="store_true", help="query a local stub chat server instead of --url")
+    parser.add_argument("--stub-delay", type=float, default=0.2, help="stub answer time in seconds")
+    parser.add_argument("--max-p95", type=float, help="fail if p95 latency exceeds this many seconds")
+    parser.add_argument("--min-score", action="append", default=[], metavar="METRIC=VALUE",
+                        help="fail if the average RAGAs metric is below VALUE (repeatable)")
+    parser.add_argument("--summary", default="evaluation_summary.json")
+    args = parser.parse_args()
+
+    try:
+        eval_df = load_dataset(args.dataset)
+    except FileNotFoundError:
+        print(f"Error: Evaluation dataset not found at {args.dataset}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error loading or processing dataset: {e}")
+        sys.exit(1)
+
+    api_url = start_stub_server(eval_df, args.stub_delay) if args.stub else args.url
+    # The stub listens on a random port, so its responses are cached under a fixed scope
+    scope = f"{'stub' if args.stub else api_url}#{args.run_id}"
+    cache = ResponseCache(args.cache)
+    elapsed, answered = collect_responses(eval_df, api_url, cache, args.concurrency, scope)
+
+    results_list = []
+    for _, row in eval_df.iterrows():
+        question = str(row['question']) # Ensure question is string
+        response_data = cache.get(ResponseCache.key(scope, question))
+        if response_data is None:
+            continue
+        results_list.append({
+            "question": question,
+            "answer": response_data['answer'],
+            "contexts": response_data['contexts'],
+            "ground_truth": str(row['ground_truth_answer']), # RAGAs expects 'ground_truth'
+            "latency_seconds": response_data['latency_seconds'],
+            "cached_by_server": response_data.get('cached_by_server', False),
+            "server_timings": response_data.get('server_timings'),
+        })
+    if len(results_list) < len(eval_df):
+        print(f"Only {len(results_list)}/{len(eval_df)} questions have responses; rerun to resume.")
+
+    summary = {"latency": latency_report(results_list, elapsed, answered)}
+    print("\n--- Latency ---")
+    print(json.dumps(summary["latency"], indent=2))
+
+    if not args.skip_ragas and results_list:
+        try:
+            summary["scores"] = run_ragas(pd.DataFrame(results_list))
+            print("\n--- Average Scores ---")
+            print(json.dumps(summary["scores"], indent=2))
+        except Exception as e:
+            print(f"An error occurred during RAGAs evaluation: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # --- Release gate ---
+    failures = []
+    p95 = summary["latency"].get("latency_p95_seconds")
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        failures.append(f"p95 latency {p95}s exceeds {args.max_p95}s")
+    for name, threshold in _parse_min_scores(args.min_score).items():
+        value = summary.get("scores", {}).get(name)
+        if value is None or value < threshold:
+            failures.append(f"{name} {value} is below {threshold}")
+    summary["gate_failures"] = failures
+
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nSummary saved to {args.summary}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Evaluation passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,8 +42,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
 // To something like this (using the URL you copied):
 // const API_URL = "https://zqdv8lvl-8000.inc1.devtunnels.ms/api";
-// NEW: A global variable to store the conversation history
-let chatHistory = [];
+// The conversation history lives on the server; we only keep its session id
+let sessionId = null;
 // let knowledgeBaseSources = [];
 
 async function uploadFile() {
@@ -81,7 +81,9 @@ async function uploadFile() {
         }
 
         const result = await response.json();
-        status.textContent = result.message || "Upload successful!";
+        status.textContent = result.message;
+        await waitForJob(result.job_id, status);
+        status.textContent = "Upload successful!";
         
         // --- NEW LOGIC ---
         // if (!knowledgeBaseSources.includes(filename)) {
@@ -141,42 +143,63 @@ async function askQuestion() {
     askButton.disabled = true;
 
     try {
-        const response = await fetch(`${API_URL}/chat`, {
+        const response = await fetch(`${API_URL}/chat/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
                 query: query,
-                chat_history: chatHistory 
+                session_id: sessionId,
+                new_session: !sessionId
             }),
         });
 
+        if (response.status === 404 && sessionId) {
+            // The session expired on the server; the next question starts a new one
+            sessionId = null;
+        }
         if (!response.ok) {
             const errorText = await response.text();
             throw new Error(`Server responded with ${response.status}: ${errorText || response.statusText}`);
         }
 
-        const result = await response.json();
-        
-        // --- Update the "thinking" message with the real answer ---
-        botThinkingMessage.innerHTML = result.answer.replace(/\n/g, '<br>');
-
-        // --- Update the source display ---
-        sourceContainer.innerHTML = ''; // Clear previous sources
-        if (result.sources && result.sources.length > 0) {
-            result.sources.forEach((source, index) => {
-                const sourceDiv = document.createElement('div');
-                sourceDiv.innerHTML = `
-                    <strong>Source ${index + 1} (from ${source.metadata.source || 'N/A'}):</strong>
-                    <p>${source.content.replace(/\n/g, '<br>')}</p>
-                `;
-                sourceContainer.appendChild(sourceDiv);
-            });
-        } else {
-            sourceContainer.innerHTML = "<p>No specific sources were retrieved for this answer.</p>";
+        // --- Read the server-sent events as they arrive ---
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const eventLine = frame.split('\n').find(line => line.startsWith('event: '));
+                const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+                if (!eventLine || !dataLine) continue;
+                const event = eventLine.slice(7);
+                const data = JSON.parse(dataLine.slice(6));
+
+                if (event === 'sources') {
+                    renderSources(sourceContainer, data.sources);
+                } else if (event === 'token') {
+                    answer += data.token;
+                    botThinkingMessage.innerHTML = answer.replace(/\n/g, '<br>');
+                    answerContainer.scrollTop = answerContainer.scrollHeight;
+                } else if (event === 'done') {
+                    answer = data.answer;
+                    sessionId = data.session_id;
+                    botThinkingMessage.innerHTML = answer.replace(/\n/g, '<br>');
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                }
+            }
         }
-        
-        // --- Update chat history ---
-        chatHistory.push([query, result.answer]);
 
     } catch (error) {
         console.error('An error occurred during chat:', error);
@@ -189,6 +212,42 @@ async function askQuestion() {
     }
 }
 
+// Polls a background ingestion job until it finishes, showing its progress.
+async function waitForJob(jobId, statusElement) {
+    while (true) {
+        const response = await fetch(`${API_URL}/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`Could not read job status (${response.status})`);
+        }
+        const job = await response.json();
+        if (job.status === 'completed') return job;
+        if (job.status === 'failed') throw new Error(job.error || 'Ingestion failed');
+
+        if (job.chunks_total > 0) {
+            statusElement.textContent = `${job.stage}: ${job.chunks_embedded}/${job.chunks_total} chunks`;
+        } else {
+            statusElement.textContent = `${job.stage}...`;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function renderSources(sourceContainer, sources) {
+    sourceContainer.innerHTML = ''; // Clear previous sources
+    if (sources && sources.length > 0) {
+        sources.forEach((source, index) => {
+            const sourceDiv = document.createElement('div');
+            sourceDiv.innerHTML = `
+                <strong>Source ${index + 1} (from ${source.metadata.source || 'N/A'}):</strong>
+                <p>${source.content.replace(/\n/g, '<br>')}</p>
+            `;
+            sourceContainer.appendChild(sourceDiv);
+        });
+    } else {
+        sourceContainer.innerHTML = "<p>No specific sources were retrieved for this answer.</p>";
+    }
+}
+
 // ADD THIS NEW FUNCTION TO YOUR SCRIPT.JS FILE
 
 async function ingestWebsite() {
@@ -221,7 +280,9 @@ async function ingestWebsite() {
         }
 
         const result = await response.json();
-        status.textContent = result.message || "Ingestion successful!";
+        status.textContent = result.message;
+        await waitForJob(result.job_id, status);
+        status.textContent = "Ingestion successful!";
 
         // // --- NEW LOGIC ---
         // if (!knowledgeBaseSources.includes(url)) {
@@ -267,7 +328,10 @@ async function resetKnowledgeBase() {
 
         // Clear the frontend state as well
         answerContainer.innerHTML = '';
-        chatHistory = [];
+        if (sessionId) {
+            fetch(`${API_URL}/sessions/${sessionId}`, { method: 'DELETE' });
+        }
+        sessionId = null;
 
     } catch (error) {
         console.error('Error resetting knowledge base:', error);